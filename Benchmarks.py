@@ -0,0 +1,187 @@
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import numpy as np
+import Lattice
+import Symmetry
+import Pattern
+import StructureFactor
+import Slab
+import Screen
+import Growth
+import Dynamical
+
+# One representative space group for every crystal system (plus the common semiconductor structures), with lattice parameters in the format expected by
+# Lattice._define_parameters_ for that system.
+representative_cases = {
+    'P1': (1, [4.1, 4.6, 5.2, 82., 95., 101.], ['Si'], [[0.1, 0.2, 0.3]]),
+    'P2_1/c': (14, [5.1, 6.2, 7.3, 104.], ['Si'], [[0.1, 0.2, 0.3]]),
+    'Pnma': (62, [5.1, 6.2, 7.3], ['Si'], [[0.1, 0.25, 0.3]]),
+    'I4/mmm': (139, [3.9, 12.7], ['Sr', 'Ti'], [[0., 0., 0.], [0., 0., 0.5]]),
+    'P-3m1': (164, [4.2, 90., 90., 120.], ['Bi'], [[0., 0., 0.4]]),
+    'P6_3/mmc': (194, [3.2, 5.2], ['Ga', 'N'], [[1. / 3., 2. / 3., 0.], [1. / 3., 2. / 3., 0.375]]),
+    'F-43m': (216, 5.65, ['Ga', 'As'], [[0., 0., 0.], [0.25, 0.25, 0.25]]),
+    'Fm-3m': (225, 4.08, ['Au'], [[0., 0., 0.]]),
+    'Fd-3m': (227, 5.43, ['Si'], [[0., 0., 0.]]),
+}
+reconstructions = ['p-1X1-R0', 'p-2X1-R0', 'c-4X2-R0']
+supercells = {'1X1': [[1, 0], [0, 1]], '2X1': [[2, 0], [0, 1]], '7X7': [[7, 0], [0, 7]]}
+
+def _parameters_for_group_(number):
+    # Parameters accepted by Lattice._define_parameters_ for every range of space group numbers.
+    if number < 3:
+        return [4.1, 4.6, 5.2, 82., 95., 101.]
+    elif number < 16:
+        return [5.1, 6.2, 7.3, 104.]
+    elif number < 75:
+        return [5.1, 6.2, 7.3]
+    elif number < 143:
+        return [3.9, 6.1]
+    elif number < 168:
+        return [4.2, 90., 90., 120.]
+    elif number < 195:
+        return [3.2, 5.2]
+    return 5.43
+
+def time_function(function, repeat = 5, min_time = 0.02):
+    """
+    Times function() as timeit does: calls are grouped in loops of number calls, with number chosen so that a loop lasts at least min_time seconds,
+    and the loop is repeated repeat times. Returns the min and median time per call (in seconds) and the number of calls per loop.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 10 ** 6:
+            break
+        number *= 10
+    timings = [elapsed / number]
+    for i in range(repeat - 1):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {'min': min(timings), 'median': float(np.median(timings)), 'number': number}
+
+def _lattice_benchmarks_(cases):
+    benchmarks = {}
+    for name, (space_group, parameters, elements, coordinates) in cases.items():
+        arguments = (space_group, parameters, elements, coordinates, [0, 0, 1], 'p-1X1-R0')
+        lattice = Lattice.Lattice(*arguments)
+        def construction_cold(arguments = arguments):
+            Symmetry.expansion_cache.clear()
+            Lattice.Lattice(*arguments)
+        benchmarks['construction/cold/' + name] = construction_cold
+        benchmarks['construction/cached/' + name] = lambda arguments = arguments: Lattice.Lattice(*arguments)
+        benchmarks['define_parameters/' + name] = lambda lattice = lattice, space_group = space_group, parameters = parameters: lattice._define_parameters_(space_group, parameters)
+        benchmarks['symmetry_expansion/' + name] = lambda space_group = space_group, elements = elements, coordinates = coordinates: Symmetry.expand_sites(space_group, elements, coordinates)
+        for miller in ([0, 0, 1], [1, 1, 0], [1, 1, 1]):
+            kvec = np.dot(miller, lattice.Bmat)
+            benchmarks['hkl_oriented_lattice/{0}/{1}'.format(name, ''.join(map(str, miller)))] = lambda lattice = lattice, kvec = kvec: lattice._get_hkl_oriented_lattice_(kvec)
+        for reconstruction in reconstructions:
+            benchmarks['surface/{0}/{1}'.format(name, reconstruction)] = lambda lattice = lattice, reconstruction = reconstruction: lattice._get_surface_(lattice.rotAmat, reconstruction)
+    return benchmarks
+
+def _all_groups_benchmarks_():
+    benchmarks = {}
+    for number in range(1, 231):
+        arguments = (number, _parameters_for_group_(number), ['Si'], [[0.1, 0.2, 0.3]], [0, 0, 1], 'p-1X1-R0')
+        def construction_cold(arguments = arguments):
+            Symmetry.expansion_cache.clear()
+            Lattice.Lattice(*arguments)
+        benchmarks['construction/cold/{0}'.format(number)] = construction_cold
+    return benchmarks
+
+def _pipeline_benchmarks_():
+    benchmarks = {}
+    silicon = Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], [0, 0, 1], 'p-2X1-R0')
+    surfBmat = 2 * np.pi / 3.84 * np.eye(2)
+    for order in (20, 160):
+        benchmarks['pattern/kinematic/order{0}'.format(order)] = lambda order = order: Pattern.KinematicPattern(surfBmat, 15000., np.linspace(1., 4., 16), 0., order)
+    benchmarks['pattern/azimuthal_scan/3600'] = lambda: Pattern.AzimuthalScan(surfBmat, 15000., 2., np.arange(0., 360., 0.1), 10)
+    random = np.random.default_rng(0)
+    G = random.random((10 ** 5, 3)) * 8.
+    for n_atoms in (8, 100):
+        structure_factor = StructureFactor.StructureFactor(random.random((n_atoms, 3)) * 20., random.integers(0, 2, n_atoms), ['Ga', 'As'])
+        benchmarks['structure_factor/1e5_reflections/{0}_atoms'.format(n_atoms)] = lambda structure_factor = structure_factor: structure_factor.intensities(G)
+    rods = np.dot(Pattern.rod_indexes(20), silicon.Bmat[:2, :2])
+    qz = np.linspace(0.1, 8., 64)
+    G_rods = np.concatenate((np.repeat(rods, len(qz), axis = 0), np.tile(qz, len(rods))[:, np.newaxis]), axis = 1)
+    silicon_factor = StructureFactor.StructureFactor(silicon.base_coordinates, silicon.base_species, silicon.species_table)
+    orbits = StructureFactor.lattice_reflection_orbits(silicon, G_rods)
+    benchmarks['structure_factor/rods/full'] = lambda: silicon_factor.intensities(G_rods)
+    benchmarks['structure_factor/rods/symmetric'] = lambda: silicon_factor.symmetric_intensities(orbits)
+    for name, supercell in supercells.items():
+        benchmarks['slab/{0}/10_layers'.format(name)] = lambda supercell = supercell: Slab.Slab(silicon.Amat, silicon.base_coordinates, silicon.base_species, 10, supercell)
+    screen = Screen.Screen(300., (100., 80.), (400, 320), (0.5, 0.5), 3.)
+    benchmarks['screen/scan_64_frames'] = lambda: sum(1 for frame in screen.scan_frames(surfBmat, 15000., 2., np.arange(64.)))
+    reflections = Growth.specular_reflections(np.linspace(1., 5., 32))
+    def growth():
+        film = Growth.Growth(silicon.Amat, silicon.base_coordinates, silicon.base_species, silicon.species_table, reflections, 200)
+        for intensities in film.run(Growth.distributed_growth(0.01, 0.5, 200), 1000):
+            pass
+    benchmarks['growth/1000_steps'] = growth
+    engine_arguments = (silicon.Amat, silicon.base_coordinates, silicon.base_species, silicon.species_table, 15000., np.linspace(0.5, 4., 8))
+    benchmarks['dynamical/21_beams'] = lambda: Dynamical.DynamicalRHEED(*engine_arguments, n_beams = 21, n_cells = 10).run()
+    return benchmarks
+
+def run_benchmarks(stages = None, all_groups = False, repeat = 5, min_time = 0.02, verbose = True):
+    """
+    Runs the benchmarks whose name starts with one of the stages (all of them if stages is None) and returns the results dictionary, ready to be
+    dumped to JSON.
+    """
+    benchmarks = _lattice_benchmarks_(representative_cases)
+    if all_groups:
+        benchmarks.update(_all_groups_benchmarks_())
+    benchmarks.update(_pipeline_benchmarks_())
+    results = {}
+    for name, function in benchmarks.items():
+        if stages is not None and not any(name.startswith(stage) for stage in stages):
+            continue
+        results[name] = time_function(function, repeat, min_time)
+        if verbose:
+            print('{0:60s} {1:12.3e} s'.format(name, results[name]['min']))
+    return {'metadata': {'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform()}, 'results': results}
+
+def compare(results, baseline, threshold = 0.2):
+    """
+    Compares the min timings of the benchmarks present in both results dictionaries. Returns the list of (name, ratio) of the regressions, i.e. the
+    benchmarks slower than the baseline by more than the threshold fraction.
+    """
+    regressions = []
+    for name, timing in results['results'].items():
+        if name in baseline['results']:
+            ratio = timing['min'] / baseline['results'][name]['min']
+            if ratio > 1. + threshold:
+                regressions.append((name, ratio))
+    return regressions
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Times every stage of the RHEED simulation pipeline.')
+    parser.add_argument('--output', default = None, help = 'JSON file where the results are written')
+    parser.add_argument('--baseline', default = None, help = 'JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type = float, default = 0.2, help = 'allowed slowdown fraction before a benchmark counts as a regression')
+    parser.add_argument('--stages', nargs = '*', default = None, help = 'only run the benchmarks whose name starts with one of these prefixes')
+    parser.add_argument('--all-groups', action = 'store_true', help = 'also time the construction of a lattice for each of the 230 space groups')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'number of timing repetitions of every benchmark')
+    arguments = parser.parse_args(arguments)
+    results = run_benchmarks(arguments.stages, arguments.all_groups, arguments.repeat)
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent = 1)
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), arguments.threshold)
+        for name, ratio in regressions:
+            print('REGRESSION {0}: {1:.2f}x slower than the baseline'.format(name, ratio))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
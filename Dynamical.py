@@ -0,0 +1,201 @@
+import time
+import numpy as np
+import Pattern
+import StructureFactor
+import Errors
+
+def star_product(SA, SB):
+    """
+    Redheffer star product of two stacks of scattering matrices, each given as the tuple (S11, S12, S21, S22) of (..., N, N) arrays: SA is the upper
+    (vacuum side) block, SB the lower one.
+    """
+    A11, A12, A21, A22 = SA
+    B11, B12, B21, B22 = SB
+    identity = np.eye(A11.shape[-1])
+    D = np.swapaxes(np.linalg.solve(np.swapaxes(identity - np.matmul(B11, A22), -1, -2), np.swapaxes(A12, -1, -2)), -1, -2)
+    F = np.swapaxes(np.linalg.solve(np.swapaxes(identity - np.matmul(A22, B11), -1, -2), np.swapaxes(B21, -1, -2)), -1, -2)
+    return (A11 + np.matmul(D, np.matmul(B11, A21)), np.matmul(D, B12), np.matmul(F, A21), B22 + np.matmul(F, np.matmul(A22, B12)))
+
+def shift_in_plane(S, phases):
+    """
+    Scattering matrices of the same block translated in plane: D S D^-1 for every block, with D = diag(phases) the phase factors exp(i g . t) that
+    the translation t gives to the beams.
+    """
+    ratios = phases[:, np.newaxis] / phases[np.newaxis, :]
+    return tuple(block * ratios for block in S)
+
+def star_power(S, n, phases = None):
+    """
+    S star S star ... (n times), computed by repeated doubling with log2(n) star products. When the phases of the in plane translation between a
+    block and the next one are given (stacking along an oblique vector), every block is shifted by one translation more than the block above it.
+    """
+    result, result_phases, S_phases = None, None, phases
+    while n > 0:
+        if n % 2 == 1:
+            if result is None:
+                result, result_phases = S, S_phases
+            else:
+                result = star_product(result, S if phases is None else shift_in_plane(S, result_phases))
+                result_phases = None if phases is None else result_phases * S_phases
+        n //= 2
+        if n > 0:
+            S = star_product(S, S if phases is None else shift_in_plane(S, S_phases))
+            S_phases = None if phases is None else S_phases ** 2
+    return result
+
+def _sqrt_upper_(values):
+    # Branch of the square root with non negative imaginary part, so that exp(i q d) never grows with depth.
+    roots = np.sqrt(values.astype(complex))
+    roots = np.where(roots.imag < 0., - roots, roots)
+    return np.where(np.abs(roots) < 10 ** (-12), 10 ** (-12), roots)
+
+class DynamicalRHEED():
+    def __init__(self, cellAmat, coordinates, species, symbols, energy, incidence, azimuth = 0., n_beams = 21, slice_thickness = 0.25, n_cells = 20, absorption = 0.1, tail = 2.):
+        """
+        Dynamical RHEED calculation along the surface normal. The crystal is the periodic repetition, n_cells times down along cellAmat[2], of the cell whose
+        in plane vectors are cellAmat[:2, :2] and whose thickness is cellAmat[2, 2] (the hkl oriented rotAmat of a Lattice), holding the atoms
+        (coordinates, species, symbols). Each cell is cut into slices of about slice_thickness Angstrom, plus the tail Angstrom of vacuum above the surface
+        where the atomic potentials still extend; the n_beams in plane reciprocal rods closest to the origin are coupled by the slice potentials.
+        Scattering matrices are computed once per slice type, for all the incidence angles together, and then stacked with star products.
+        absorption is the ratio between the imaginary and the real part of the crystal potential. Angles are in degrees.
+        Nothing heavy is done here: call estimate() to know the expected cost and run() to compute the reflected intensities.
+        """
+        self.cellAmat = np.array(cellAmat, dtype = float)
+        self.coordinates = np.asarray(coordinates, dtype = float).reshape(-1, 3)
+        self.species = np.asarray(species, dtype = int).reshape(-1)
+        self.symbols = [str(symbol) for symbol in symbols]
+        self.energy = energy
+        self.incidence = np.atleast_1d(np.asarray(incidence, dtype = float)).ravel()
+        self.azimuth = azimuth
+        self.n_cells = int(n_cells)
+        self.absorption = absorption
+        if n_cells < 1 or slice_thickness <= 0.:
+            raise Errors.WrongSlicing(slice_thickness, n_cells)
+        self.k = Pattern.electron_wavevector(energy)
+        self.gamma = 1. + Pattern.elementary_charge * energy / (Pattern.electron_mass * Pattern.speed_of_light ** 2)
+        self.surfAmat = self.cellAmat[:2, :2]
+        self.surfBmat = 2 * np.pi * np.transpose(np.linalg.inv(self.surfAmat))
+        self.thickness = self.cellAmat[2, 2]
+        self._define_beams_(n_beams)
+        self._define_slices_(slice_thickness, tail)
+        self.slice_matrices = {}
+
+    def _define_beams_(self, n_beams):
+        order = int(np.ceil(np.sqrt(n_beams))) + 1
+        hk = Pattern.rod_indexes(order)
+        gnorm = np.linalg.norm(np.dot(hk, self.surfBmat), axis = 1)
+        self.hk = hk[np.argsort(gnorm, kind = 'stable')[:n_beams]]
+        self.n_beams = len(self.hk)
+        self.rods = np.dot(self.hk, self.surfBmat)
+        differences = (self.hk[:, np.newaxis, :] - self.hk[np.newaxis, :, :]).reshape(-1, 2)
+        self.differences, self.coupling_indexes = np.unique(differences, axis = 0, return_inverse = True)
+        self.coupling_indexes = self.coupling_indexes.reshape(self.n_beams, self.n_beams)
+
+    def _define_slices_(self, slice_thickness, tail):
+        cell_slices = int(np.ceil(self.thickness / slice_thickness))
+        tail_slices = int(np.ceil(tail / slice_thickness))
+        self.dz = self.thickness / cell_slices
+        # Heights of the upper boundaries of the slices, from the top of the tail down to the bottom of one cell; the top cell spans [0, thickness).
+        cell_tops = self.thickness - self.dz * np.arange(cell_slices)
+        tail_tops = self.thickness + self.dz * np.arange(tail_slices, 0, -1)
+        self.slice_tops = {'tail': tail_tops, 'surface': cell_tops, 'bulk': cell_tops}
+
+    def _get_slice_potentials_(self, tops, images):
+        """
+        (M, S) in plane Fourier components U_g of the potential (in Angstrom^-2, for the M coupling vectors g) averaged over the S slices with the given
+        upper boundaries, summing the Doyle-Turner gaussian potentials of the atoms of the cell shifted by the given numbers of cells along z.
+        """
+        from scipy.special import erf
+        G = np.dot(self.differences, self.surfBmat)
+        parameters = np.array([StructureFactor.form_factor_parameters(symbol) for symbol in self.symbols])
+        a, beta = parameters[:, :, 0], parameters[:, :, 1] / (16 * np.pi ** 2)
+        beta = np.where(beta > 0., beta, 1.)
+        positions = (self.coordinates[np.newaxis, :, :] + np.multiply.outer(np.array(images, dtype = float), self.cellAmat[2])[:, np.newaxis, :]).reshape(-1, 3)
+        heights = positions[:, 2]
+        atoms_species = np.tile(self.species, len(images))
+        atoms_beta = beta[atoms_species]
+        upper = (tops[np.newaxis, np.newaxis, :] - heights[:, np.newaxis, np.newaxis]) / (2 * np.sqrt(atoms_beta))[:, :, np.newaxis]
+        profiles = np.pi * (erf(upper) - erf(upper - self.dz / (2 * np.sqrt(atoms_beta))[:, :, np.newaxis])) / self.dz
+        phases = np.exp(- 1j * np.dot(G, positions[:, :2].T))
+        coefficients = (a[atoms_species] * np.exp(- np.multiply.outer(np.sum(G ** 2, axis = 1), atoms_beta)))
+        area = abs(np.linalg.det(self.surfAmat))
+        potentials = 2 * self.gamma / area * np.einsum('mj,mji,jis->ms', phases, coefficients, profiles)
+        return potentials * (1. + 1j * self.absorption)
+
+    def _get_gamma2_(self):
+        kin = Pattern.incident_wavevector(self.k, self.incidence, self.azimuth)
+        parallel = kin[:, np.newaxis, :2] + self.rods[np.newaxis, :, :]
+        return self.k ** 2 - np.sum(parallel ** 2, axis = -1)
+
+    def _get_slice_scattering_matrices_(self, potentials, gamma2, q0):
+        """
+        Scattering matrices, relative to the vacuum modes q0, of every slice (stacked over the incidence angles) with the given potentials.
+        """
+        matrices = []
+        for potential in np.transpose(potentials):
+            A = potential[self.coupling_indexes][np.newaxis, :, :] + gamma2[:, :, np.newaxis] * np.eye(self.n_beams)
+            eigenvalues, W = np.linalg.eig(A)
+            q = _sqrt_upper_(eigenvalues)
+            W_inverse = np.linalg.inv(W)
+            Vinverse_V0 = W_inverse / q[:, :, np.newaxis] * q0[:, np.newaxis, :]
+            A_ = W_inverse + Vinverse_V0
+            B_ = W_inverse - Vinverse_V0
+            X = np.exp(1j * q * self.dz)[:, :, np.newaxis]
+            A_inverse = np.linalg.inv(A_)
+            XBAinv = np.matmul(X * B_, A_inverse)
+            D = A_ - np.matmul(XBAinv, X * B_)
+            S11 = np.linalg.solve(D, np.matmul(XBAinv, X * A_) - B_)
+            S12 = np.linalg.solve(D, X * (A_ - np.matmul(B_, np.matmul(A_inverse, B_))))
+            matrices.append((S11, S12, S12, S11))
+        return matrices
+
+    def _get_stack_(self, kind, gamma2, q0, images):
+        if kind not in self.slice_matrices:
+            potentials = self._get_slice_potentials_(self.slice_tops[kind], images)
+            self.slice_matrices[kind] = self._get_slice_scattering_matrices_(potentials, gamma2, q0)
+        stack = self.slice_matrices[kind][0]
+        for S in self.slice_matrices[kind][1:]:
+            stack = star_product(stack, S)
+        return stack
+
+    def estimate(self):
+        """
+        Expected cost of run(): number of slice types, memory (in bytes) of the cached scattering matrices and of the work arrays and expected time
+        (in seconds), extrapolated from a calibration product of matrices of the actual size.
+        """
+        n_angles, n = len(self.incidence), self.n_beams
+        slice_types = sum(len(tops) for tops in self.slice_tops.values())
+        star_products = slice_types + 2 * int(np.ceil(np.log2(max(self.n_cells, 2))))
+        # complex operations: ~25 N^3 per eigen decomposition and ~10 N^3 for the other products of every slice type, ~12 N^3 per star product
+        operations = n_angles * n ** 3 * (35 * slice_types + 12 * star_products)
+        sample = np.ones((n_angles, n, n), dtype = complex)
+        start = time.perf_counter()
+        np.matmul(sample, sample)
+        rate = n_angles * n ** 3 / max(time.perf_counter() - start, 10 ** (-6))
+        return {'beams': n, 'angles': n_angles, 'slice_types': slice_types, 'star_products': star_products, 'memory_bytes': (2 * slice_types + 16) * n_angles * n * n * 16, 'operations': operations, 'seconds': operations / rate}
+
+    def run(self):
+        """
+        Returns the (angles, beams) array of the reflected intensities of the hk beams, normalized to the incident flux (zero for evanescent beams).
+        """
+        gamma2 = self._get_gamma2_()
+        q0 = _sqrt_upper_(gamma2)
+        tail = self._get_stack_('tail', gamma2, q0, [0])
+        surface = self._get_stack_('surface', gamma2, q0, [-1, 0])
+        S = star_product(tail, surface)
+        if self.n_cells > 1:
+            # Cell n lies n stacking vectors (cellAmat[2]) below the surface cell, shifted in plane by n times its in plane part.
+            phases = np.exp(1j * np.dot(self.rods, self.cellAmat[2, :2]))
+            bulk = self._get_stack_('bulk', gamma2, q0, [-1, 0, 1])
+            S = star_product(S, shift_in_plane(star_power(bulk, self.n_cells - 1, phases), phases))
+        specular = np.nonzero(np.all(self.hk == 0, axis = 1))[0][0]
+        reflected = S[0][:, :, specular]
+        propagating = gamma2 > 0.
+        self.reflectivities = np.where(propagating, np.abs(reflected) ** 2 * q0.real / q0[:, specular, np.newaxis].real, 0.)
+        return self.reflectivities
+
+def lattice_engine(lattice, energy, incidence, azimuth = 0., n_beams = 21, slice_thickness = 0.25, n_cells = 20, absorption = 0.1):
+    """
+    DynamicalRHEED engine for the hkl oriented slab of a Lattice (rotAmat and rotbase_coordinates).
+    """
+    return DynamicalRHEED(lattice.rotAmat, lattice.rotbase_coordinates, lattice.base_species, lattice.species_table, energy, incidence, azimuth, n_beams, slice_thickness, n_cells, absorption)
@@ -0,0 +1,68 @@
+import numpy as np
+import Dynamical
+import Lattice
+
+def cscl_type(miller_indexes):
+    return Lattice.Lattice(221, 9.0, ['C', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]], miller_indexes, 'p-1X1-R0')
+
+def test_oblique_stacking():
+    # The (111) cell is stacked along an oblique vector: the bulk must match the stack of the explicitly translated cells.
+    lattice = cscl_type([1, 1, 1])
+    cell, coordinates = np.array(lattice.rotAmat), np.array(lattice.rotbase_coordinates)
+    assert np.linalg.norm(cell[2, :2]) > 1.
+    incidence, n_cells = np.linspace(0.5, 4., 4), 5
+    engine = Dynamical.DynamicalRHEED(cell, coordinates, lattice.base_species, lattice.species_table, 10000., incidence, 5., n_beams = 7, n_cells = n_cells)
+    reflectivities = engine.run()
+    gamma2 = engine._get_gamma2_()
+    q0 = Dynamical._sqrt_upper_(gamma2)
+    S = Dynamical.star_product(engine._get_stack_('tail', gamma2, q0, [0]), engine._get_stack_('surface', gamma2, q0, [-1, 0]))
+    for n in range(1, n_cells):
+        shifted = Dynamical.DynamicalRHEED(cell, coordinates - n * np.array([cell[2, 0], cell[2, 1], 0.]), lattice.base_species, lattice.species_table, 10000., incidence, 5., n_beams = 7, n_cells = n_cells)
+        S = Dynamical.star_product(S, shifted._get_stack_('bulk', gamma2, q0, [-1, 0, 1]))
+    specular = np.nonzero(np.all(engine.hk == 0, axis = 1))[0][0]
+    expected = np.where(gamma2 > 0., np.abs(S[0][:, :, specular]) ** 2 * q0.real / q0[:, specular, np.newaxis].real, 0.)
+    assert np.allclose(reflectivities, expected, rtol = 10 ** (-10), atol = 10 ** (-14))
+
+class UniformSlab(Dynamical.DynamicalRHEED):
+    # Uniform potential U0 inside the crystal and none in the vacuum tail.
+    U0 = 0.5
+
+    def _get_slice_potentials_(self, tops, images):
+        inside = np.where(tops <= self.thickness + 10 ** (-12), self.U0, 0.)
+        return np.tile(inside, (len(self.differences), 1)) * (1. + 1j * self.absorption)
+
+def test_fresnel_reflectivity():
+    incidence = np.linspace(0.2, 5., 25)
+    engine = UniformSlab(5.43 * np.eye(3), [[0., 0., 0.]], [0], ['Si'], 10000., incidence, n_beams = 1, n_cells = 2000, absorption = 0.1)
+    reflectivities = engine.run()[:, 0]
+    q0 = Dynamical._sqrt_upper_(engine._get_gamma2_()[:, 0])
+    q = Dynamical._sqrt_upper_(q0 ** 2 + UniformSlab.U0 * (1. + 0.1j))
+    assert np.allclose(reflectivities, np.abs((q0 - q) / (q0 + q)) ** 2, rtol = 10 ** (-8), atol = 10 ** (-14))
+
+def test_multislice_admittance_matches_scattering_matrices():
+    # Independent multislice solution: the surface admittance Y (dpsi/dz = Y psi, i q0 below the slab) is carried up slice by slice, which stays
+    # stable for the strongly evanescent beams, and gives the reflected amplitudes r = (Y + i q0)^-1 (i q0 - Y) inc at the top.
+    lattice = Lattice.Lattice(221, 4.0, ['C', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]], [0, 0, 1], 'p-1X1-R0')
+    incidence, n_cells = np.linspace(0.5, 4., 5), 8
+    engine = Dynamical.lattice_engine(lattice, 10000., incidence, 3., n_beams = 21, n_cells = n_cells)
+    reflectivities = engine.run()
+    gamma2 = engine._get_gamma2_()
+    q0 = Dynamical._sqrt_upper_(gamma2)
+    potentials = np.concatenate([engine._get_slice_potentials_(engine.slice_tops['tail'], [0]), engine._get_slice_potentials_(engine.slice_tops['surface'], [-1, 0])] + [engine._get_slice_potentials_(engine.slice_tops['bulk'], [-1, 0, 1])] * (n_cells - 1), axis = 1)
+    specular = np.nonzero(np.all(engine.hk == 0, axis = 1))[0][0]
+    incident = np.eye(engine.n_beams)[specular]
+    for angle in range(len(incidence)):
+        Q0 = np.diag(1j * q0[angle])
+        Y = Q0
+        for potential in np.transpose(potentials)[::-1]:
+            A = potential[engine.coupling_indexes] + gamma2[angle][:, np.newaxis] * np.eye(engine.n_beams)
+            eigenvalues, W = np.linalg.eig(A)
+            q = np.sqrt(eigenvalues.astype(complex))
+            W_inverse = np.linalg.inv(W)
+            C = np.dot(W * np.cos(q * engine.dz), W_inverse)
+            S = np.dot(W * (np.sin(q * engine.dz) / q), W_inverse)
+            Y = np.linalg.solve(C - np.dot(Y, S), np.dot(Y, C) + np.dot(A, S))
+        r = np.linalg.solve(Y + Q0, np.dot(Q0 - Y, incident))
+        expected = np.where(gamma2[angle] > 0., np.abs(r) ** 2 * q0[angle].real / q0[angle, specular].real, 0.)
+        assert np.sort(expected)[-2] > 10 ** (-4)
+        assert np.allclose(reflectivities[angle], expected, rtol = 10 ** (-9), atol = 10 ** (-13))
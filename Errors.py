@@ -1,6 +1,10 @@
 import traceback
 import sys
 
+# When False, error_handler raises the error instead of stopping the whole interpreter, so that callers running many independent jobs (e.g. Sweep workers)
+# can record the failure and go on.
+exit_on_error = True
+
 class Errors(Exception):
     """
     This class, that inherits Exception in order to become an error handling class, is only a container for the errors that can be raised in MRLab classes.
@@ -21,7 +25,10 @@ class Errors(Exception):
         """
         This function is used to properly handle an ERROR exception, printing all the informations necessary to the users (including the eventual PyVISA
         internal error number and message). After having done this, it prints also the error traceback and stops script execution calling sys.exit() method.
+        If the module level exit_on_error flag is False, the error is raised again instead.
         """
+        if not exit_on_error:
+            raise self
         self.warning_handler()
         sys.exit()
 
@@ -45,4 +52,148 @@ class WrongParametersNumber(LatticeErrors):
     def __init__(self, given, required):
         self.code = 'LATTICEERROR2'
         self.name = 'WRONG_NUMBER_OF_PARAMETERS_INSERTED'
-        self.message = 'ERROR: Please check that you have inserted the right parameters number for the selected lattice.\nYou give {0} parameters, while {1} parameters were required.\nExecution aborted.'.format(given, required)
\ No newline at end of file
+        self.message = 'ERROR: Please check that you have inserted the right parameters number for the selected lattice.\nYou give {0} parameters, while {1} parameters were required.\nExecution aborted.'.format(given, required)
+
+class WrongLatticeFile(LatticeErrors):
+    """
+    """
+    def __init__(self, filename, reason):
+        self.code = 'LATTICEERROR3'
+        self.name = 'WRONG_LATTICE_FILE'
+        self.message = 'ERROR: The given lattice file ("{0}") cannot be read: {1}.\nPlease check that the file was written by LatticeFile.save_lattice with the same format version.\nExecution aborted.'.format(filename, reason)
+
+class PatternErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Pattern classes.
+    """
+    pass
+
+class WrongBeamEnergy(PatternErrors):
+    """
+    """
+    def __init__(self, energy):
+        self.code = 'PATTERNERROR1'
+        self.name = 'WRONG_BEAM_ENERGY_SPECIFIED'
+        self.message = 'ERROR: The given beam energy ("{0}") is not valid.\nPlease check that all the beam energies are strictly positive and given in eV.\nExecution aborted.'.format(energy)
+
+class StructureFactorErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in StructureFactor classes.
+    """
+    pass
+
+class MissingFormFactor(StructureFactorErrors):
+    """
+    """
+    def __init__(self, element):
+        self.code = 'STRUCTUREFACTORERROR1'
+        self.name = 'MISSING_FORM_FACTOR_PARAMETERS'
+        self.message = 'ERROR: No electron form factor parameters are available for the given element ("{0}").\nPlease check the element symbol of every atom in the base.\nExecution aborted.'.format(element)
+
+class SlabErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Slab classes.
+    """
+    pass
+
+class WrongSupercellMatrix(SlabErrors):
+    """
+    """
+    def __init__(self, supercell):
+        self.code = 'SLABERROR1'
+        self.name = 'WRONG_SUPERCELL_MATRIX_SPECIFIED'
+        self.message = 'ERROR: The given supercell matrix ("{0}") is singular.\nPlease check that the supercell is described by two independent integer vectors.\nExecution aborted.'.format(supercell.tolist())
+
+class SweepErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Sweep classes.
+    """
+    pass
+
+class WrongSweepCheckpoint(SweepErrors):
+    """
+    """
+    def __init__(self, directory):
+        self.code = 'SWEEPERROR1'
+        self.name = 'WRONG_SWEEP_CHECKPOINT'
+        self.message = 'ERROR: The output directory ("{0}") holds the checkpoint of a sweep with a different list of jobs, or of an older format.\nPlease use a new output directory or the same jobs to resume the sweep.\nExecution aborted.'.format(directory)
+
+class TooManyAtoms(SweepErrors):
+    """
+    """
+    def __init__(self, given, maximum):
+        self.code = 'SWEEPERROR2'
+        self.name = 'TOO_MANY_BASE_ATOMS'
+        self.message = 'ERROR: The lattice base has {0} atoms, while at most {1} atoms can be stored for every job.\nPlease increase the maximum number of atoms of the sweep.\nExecution aborted.'.format(given, maximum)
+
+class WrongSweepMaxAtoms(SweepErrors):
+    """
+    """
+    def __init__(self, directory, given, stored):
+        self.code = 'SWEEPERROR3'
+        self.name = 'WRONG_SWEEP_MAX_ATOMS'
+        self.message = 'ERROR: The checkpoint in the output directory ("{0}") holds jobs with {2} base atoms, while at most {1} atoms can be stored for every job.\nPlease resume the sweep with a maximum number of atoms of at least {2}, or use a new output directory.\nExecution aborted.'.format(directory, given, stored)
+
+class DynamicalErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Dynamical classes.
+    """
+    pass
+
+class WrongSlicing(DynamicalErrors):
+    """
+    """
+    def __init__(self, slice_thickness, n_cells):
+        self.code = 'DYNAMICALERROR1'
+        self.name = 'WRONG_SLICING_SPECIFIED'
+        self.message = 'ERROR: The given slice thickness ("{0}") or number of cells ("{1}") is not valid.\nPlease check that the slice thickness is positive and that at least one cell is used.\nExecution aborted.'.format(slice_thickness, n_cells)
+
+class GrowthErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Growth classes.
+    """
+    pass
+
+class WrongGrowthLayer(GrowthErrors):
+    """
+    """
+    def __init__(self, layers, n_layers):
+        self.code = 'GROWTHERROR1'
+        self.name = 'WRONG_GROWTH_LAYER_SPECIFIED'
+        self.message = 'ERROR: The growth model changed the layers {0}, while the film only has layers from 0 to {1}.\nPlease check that the growth model was built for the same number of layers.\nExecution aborted.'.format(list(layers), n_layers - 1)
+
+class ReconstructionErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Reconstruction classes.
+    """
+    pass
+
+class WrongReconstructionNotation(ReconstructionErrors):
+    """
+    """
+    def __init__(self, notation):
+        self.code = 'RECONSTRUCTIONERROR1'
+        self.name = 'WRONG_RECONSTRUCTION_NOTATION_SPECIFIED'
+        self.message = 'ERROR: The given reconstruction ("{0}") is neither in Wood\'s nor in matrix notation.\nPlease check that you have inserted something like "p-2X1-R0", "c(4x2)", "(sqrt3 x sqrt3)R30" or "(2 1, -1 1)".\nExecution aborted.'.format(notation)
+
+class SingularReconstructionMatrix(ReconstructionErrors):
+    """
+    """
+    def __init__(self, matrix):
+        self.code = 'RECONSTRUCTIONERROR2'
+        self.name = 'SINGULAR_RECONSTRUCTION_MATRIX'
+        self.message = 'ERROR: The reconstruction matrix ("{0}") is singular.\nPlease check that the reconstructed mesh is described by two independent vectors.\nExecution aborted.'.format(matrix.round(6).tolist())
+
+class VideoErrors(Errors):
+    """
+    This class, that inherits Errors in order to become an error handling class, is only a container for the errors that can be raised in Video classes.
+    """
+    pass
+
+class WrongVideoShape(VideoErrors):
+    """
+    """
+    def __init__(self, filename, shape, dtype):
+        self.code = 'VIDEOERROR1'
+        self.name = 'WRONG_VIDEO_SHAPE_SPECIFIED'
+        self.message = 'ERROR: The size of the raw video file ("{0}") is not a multiple of the size of a {1} frame of {2} pixels.\nPlease check the frame shape, the pixel type and the header offset of the recording.\nExecution aborted.'.format(filename, shape, dtype)
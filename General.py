@@ -1,8 +1,114 @@
 import numpy as np
-import numpy.ma as ma
 
 def rotation_matrix_z_axis(theta):
-    return ma.masked_inside(np.array([[np.cos(theta), -np.sin(theta), 0.],[np.sin(theta), np.cos(theta), 0.],[0., 0., 1.]]),-10 ** (-15),10 ** (-15)).filled(0.)
+    return rotation_matrices_z_axis(theta)[0]
 
 def rotation_matrix_y_axis(phi):
-    return ma.masked_inside(np.array([[np.cos(phi), 0., np.sin(phi)],[0., 1., 0.],[-np.sin(phi), 0., np.cos(phi)]]),-10 ** (-15),10 ** (-15)).filled(0.)
\ No newline at end of file
+    return rotation_matrices_y_axis(phi)[0]
+
+def rotation_matrices_z_axis(thetas):
+    """
+    Returns the (N,3,3) stack of the rotation matrices around the z axis for the given array of N angles (in radians), built in a single array operation.
+    """
+    thetas = np.atleast_1d(np.asarray(thetas, dtype = float)).ravel()
+    cos, sin = _clean_(np.cos(thetas)), _clean_(np.sin(thetas))
+    matrices = np.zeros((len(thetas), 3, 3))
+    matrices[:, 0, 0], matrices[:, 0, 1] = cos, - sin
+    matrices[:, 1, 0], matrices[:, 1, 1] = sin, cos
+    matrices[:, 2, 2] = 1.
+    return matrices + 0.
+
+def rotation_matrices_y_axis(phis):
+    """
+    Returns the (N,3,3) stack of the rotation matrices around the y axis for the given array of N angles (in radians), built in a single array operation.
+    """
+    phis = np.atleast_1d(np.asarray(phis, dtype = float)).ravel()
+    cos, sin = _clean_(np.cos(phis)), _clean_(np.sin(phis))
+    matrices = np.zeros((len(phis), 3, 3))
+    matrices[:, 0, 0], matrices[:, 0, 2] = cos, sin
+    matrices[:, 1, 1] = 1.
+    matrices[:, 2, 0], matrices[:, 2, 2] = - sin, cos
+    return matrices + 0.
+
+def _clean_(values, tolerance = 10 ** (-15)):
+    return np.where(np.abs(values) < tolerance, 0., values)
+
+def wrap_into_cell(coordinates, Amat, tolerance = 10 ** (-10)):
+    """
+    Brings every cartesian position of the (N,3) coordinates array back into the cell spanned by the rows of Amat, all at once, through modulo arithmetic
+    on the fractional coordinates. Fractional coordinates within tolerance of 1 are folded back to 0.
+    """
+    fractional = np.mod(np.dot(coordinates, np.linalg.inv(Amat)), 1.)
+    fractional[fractional > 1. - tolerance] = 0.
+    return np.dot(fractional, Amat)
+
+def lattice_matrix(a, b, c, alpha, beta, gamma):
+    """
+    Real space lattice matrix (rows are the lattice vectors, in Angstrom) for the given parameters (angles in degrees), built with the same orientation
+    convention of pymatgen Lattice.from_parameters: c is along z and a lies in the xz plane.
+    """
+    alpha, beta, gamma = np.radians([alpha, beta, gamma])
+    cos_gamma_star = np.clip((np.cos(alpha) * np.cos(beta) - np.cos(gamma)) / (np.sin(alpha) * np.sin(beta)), -1., 1.)
+    gamma_star = np.arccos(cos_gamma_star)
+    return np.array([[a * np.sin(beta), 0., a * np.cos(beta)],[- b * np.sin(alpha) * np.cos(gamma_star), b * np.sin(alpha) * np.sin(gamma_star), b * np.cos(alpha)],[0., 0., c]])
+
+def surface_matrices(miller_indexes):
+    """
+    (N,3,3) integer unimodular matrices M for the (N,3) coprime Miller indexes h: the rows n1 and n2 of M span the lattice vectors parallel to the
+    planes (h . n = 0) and the third row has h . n3 = 1, so that M . Amat is a basis of the lattice with two vectors in the surface plane and the third
+    one crossing a single interplanar spacing. Found for the whole stack with a batched integer Euclidean reduction of the indexes.
+    """
+    values = np.array(miller_indexes, dtype = np.int64).reshape(-1, 3)
+    matrices = np.tile(np.eye(3, dtype = np.int64), (len(values), 1, 1))
+    batch = np.arange(len(values))
+    # The rows of M are combined as the entries of values = M . h, until a single entry (the gcd, +-1) is left.
+    while True:
+        nonzero = values != 0
+        active = np.sum(nonzero, axis = 1) > 1
+        if not np.any(active):
+            break
+        pivots = np.argmin(np.where(nonzero, np.abs(values), np.iinfo(np.int64).max), axis = 1)
+        pivot_values = np.where(active, values[batch, pivots], 1)
+        quotients = np.where(active[:, np.newaxis] & (np.arange(3) != pivots[:, np.newaxis]), values // pivot_values[:, np.newaxis], 0)
+        values -= quotients * pivot_values[:, np.newaxis]
+        matrices -= quotients[:, :, np.newaxis] * matrices[batch, pivots][:, np.newaxis, :]
+    last = np.argmax(values != 0, axis = 1)
+    order = np.argsort(np.arange(3) == last[:, np.newaxis], axis = 1, kind = 'stable')
+    matrices = np.take_along_axis(matrices, order[:, :, np.newaxis], axis = 1)
+    matrices[:, 2] *= np.where(values[batch, last] < 0, -1, 1)[:, np.newaxis]
+    matrices[:, 0] *= np.where(np.round(np.linalg.det(matrices)) < 0, -1, 1)[:, np.newaxis]
+    return matrices
+
+def reduce_surface_cells(cells, tolerance = 10 ** (-10)):
+    """
+    Reduces an (N,3,3) stack of cells whose first two rows lie in the surface plane (z = 0) without changing the lattices they span: the in plane
+    pairs are Lagrange-Gauss reduced (shortest vectors, |a1| <= |a2|, a1 with its first non zero component positive), the in plane part of the third vector is brought to the nearest lattice point of
+    the mesh, and the cells are made right handed with the third vector pointing upwards (z > 0).
+    """
+    cells = np.array(cells, dtype = float).reshape(-1, 3, 3)
+    a1, a2 = cells[:, 0].copy(), cells[:, 1].copy()
+    while True:
+        swap = np.sum(a1 ** 2, axis = 1) > np.sum(a2 ** 2, axis = 1) * (1. + tolerance)
+        a1, a2 = np.where(swap[:, np.newaxis], a2, a1), np.where(swap[:, np.newaxis], a1, a2)
+        ratio = np.sum(a1 * a2, axis = 1) / np.sum(a1 ** 2, axis = 1)
+        mu = np.where(np.abs(ratio) > 0.5 + tolerance, np.round(ratio), 0.)
+        if not np.any(mu != 0.):
+            break
+        a2 = a2 - mu[:, np.newaxis] * a1
+    a3 = np.where((cells[:, 2, 2] < 0.)[:, np.newaxis], - cells[:, 2], cells[:, 2])
+    mesh = np.stack((a1[:, :2], a2[:, :2]), axis = 1)
+    steps = np.round(np.linalg.solve(np.swapaxes(mesh, -1, -2), a3[:, :2, np.newaxis])[..., 0])
+    a3 = a3 - steps[:, 0, np.newaxis] * a1 - steps[:, 1, np.newaxis] * a2
+    a1 = np.where((np.take_along_axis(a1, np.argmax(np.abs(a1) > tolerance, axis = 1)[:, np.newaxis], axis = 1) < 0.), - a1, a1)
+    a2 = np.where((np.linalg.det(np.stack((a1, a2, a3), axis = 1)) < 0.)[:, np.newaxis], - a2, a2)
+    return _clean_(np.stack((a1, a2, a3), axis = 1), tolerance)
+
+def miller_indexes(max_index):
+    """
+    (N,3) array of all the distinct Miller indexes (h,k,l) with components between -max_index and max_index, excluding (0,0,0) and the multiples of
+    smaller indexes (e.g. (2,0,0)), i.e. one entry per family of parallel lattice planes and surface side.
+    """
+    h, k, l = np.mgrid[-max_index:max_index + 1, -max_index:max_index + 1, -max_index:max_index + 1]
+    indexes = np.stack((h.ravel(), k.ravel(), l.ravel()), axis = 1)
+    indexes = indexes[np.any(indexes != 0, axis = 1)]
+    return indexes[np.gcd.reduce(np.abs(indexes), axis = 1) == 1]
@@ -0,0 +1,153 @@
+import numpy as np
+import StructureFactor
+import Errors
+
+def _heights_(rate, n_layers):
+    # Deposited height after every step, computed as step * rate rather than summed, so that rounding cannot add a last step of almost nothing.
+    n_steps = int(np.ceil(n_layers / rate - 10 ** (-9)))
+    for step in range(1, n_steps + 1):
+        yield min(step * rate, n_layers) if step < n_steps else float(n_layers)
+
+def layer_by_layer(rate, n_layers):
+    """
+    Perfect layer by layer growth: each step deposits rate monolayers, that fill the lowest incomplete layer before starting the next one.
+    Generator of (changed layer indexes, their new coverages), one item per step, touching at most the layers that the deposit reaches.
+    """
+    previous = 0.
+    for height in _heights_(rate, n_layers):
+        first = int(previous)
+        previous = height
+        changed = np.arange(first, min(int(np.ceil(height)), n_layers))
+        yield changed, np.clip(height - changed, 0., 1.)
+
+def distributed_growth(rate, transport, n_layers):
+    """
+    Distributed growth rate model: the rate monolayers deposited every step land on the exposed area of every level. The transport fraction of the
+    atoms landing on top of layer n-1 hops down to fill layer n-1, the rest nucleates layer n (transport = 0 gives Poisson growth, transport = 1 almost
+    perfect layer by layer growth). Only the layers between the lowest incomplete and the highest started one are updated.
+    """
+    coverages = np.zeros(n_layers)
+    lowest, highest = 0, 0
+    while lowest < n_layers:
+        window = np.arange(lowest, min(highest + 2, n_layers))
+        below = np.where(window > 0, coverages[np.maximum(window - 1, 0)], 1.)
+        deposit = rate * (below - coverages[window])
+        new = coverages[window] + deposit
+        new[1:] -= transport * deposit[1:]
+        new[:-1] += transport * deposit[1:]
+        new = np.minimum.accumulate(np.clip(new, 0., 1.))
+        coverages[window] = new
+        yield window, new
+        while lowest < n_layers and coverages[lowest] >= 1. - 10 ** (-12):
+            coverages[lowest] = 1.
+            lowest += 1
+        while highest + 1 < n_layers and coverages[highest + 1] > 0.:
+            highest += 1
+
+def step_flow(rate, terraces, n_layers):
+    """
+    Step flow growth on a staircase of terraces equal terraces: every step advances all the step edges, so that the coverage of layer l is
+    clip(1 - (l - h) / terraces, 0, 1) after h deposited monolayers. Only the layers crossed by the staircase change at every step.
+    """
+    previous = 0.
+    for height in _heights_(rate, n_layers):
+        changed = np.arange(int(previous), min(int(np.ceil(height + terraces)), n_layers))
+        previous = height
+        yield changed, np.clip(1. - (changed - height) / terraces, 0., 1.)
+
+class Growth():
+    def __init__(self, cellAmat, coordinates, species, symbols, G, n_layers, substrate_attenuation = 0.99, layer_tolerance = 0.1):
+        """
+        Kinematic growth simulation on the stacking of the atomic monolayers of an oriented cell (cellAmat and the base coordinates/species/symbols,
+        with the surface normal along z, as rotAmat and rotbase of a Lattice). The atoms of the cell are split into monolayers by height, and film
+        layer l is monolayer l % m of the cell shifted by l // m cells along cellAmat[2]. The film grows on a semi-infinite substrate (layers l < 0)
+        whose monolayers are weighted by substrate_attenuation to the power of their depth, summed in closed form (0 means no substrate).
+        The scattering amplitudes at the (N,3) reflections G are kept as a running sum of the coverage weighted contributions of the layers, each one
+        computed once when the layer first changes, so that a step costs O(changed layers x N).
+        """
+        self.cellAmat = np.array(cellAmat, dtype = float)
+        self.G = np.asarray(G, dtype = float).reshape(-1, 3)
+        self.n_layers = int(n_layers)
+        coordinates = np.asarray(coordinates, dtype = float).reshape(-1, 3)
+        species = np.asarray(species, dtype = int).reshape(-1)
+        self._define_monolayers_(coordinates, species, symbols, layer_tolerance)
+        self.contributions = np.zeros((self.n_layers, len(self.G)), dtype = complex)
+        self.computed = np.zeros(self.n_layers, dtype = bool)
+        self.coverages = np.zeros(self.n_layers)
+        self.amplitudes = self._get_substrate_amplitudes_(substrate_attenuation)
+
+    def _define_monolayers_(self, coordinates, species, symbols, layer_tolerance):
+        order = np.argsort(coordinates[:, 2], kind = 'stable')
+        heights = coordinates[order, 2]
+        labels = np.concatenate(([0], np.cumsum(np.diff(heights) > layer_tolerance)))
+        self.monolayer_factors = []
+        for label in range(labels[-1] + 1):
+            atoms = order[labels == label]
+            structure_factor = StructureFactor.StructureFactor(coordinates[atoms], species[atoms], symbols)
+            self.monolayer_factors.append(structure_factor.compute(self.G))
+        self.n_monolayers = len(self.monolayer_factors)
+
+    def _get_substrate_amplitudes_(self, attenuation):
+        # Layer l = m - n * M (n >= 1) lies n * M - m monolayers deep: summing over n gives c_m * r^(-m) * y / (1 - y), with y = r^M * exp(-i G.a3).
+        y = attenuation ** self.n_monolayers * np.exp(- 1j * np.dot(self.G, self.cellAmat[2]))
+        amplitudes = np.zeros(len(self.G), dtype = complex)
+        if attenuation > 0.:
+            for monolayer, factors in enumerate(self.monolayer_factors):
+                amplitudes += factors * attenuation ** (- monolayer) * y / (1. - y)
+        return amplitudes
+
+    def _get_contribution_(self, layer):
+        shift = (layer // self.n_monolayers) * self.cellAmat[2]
+        return self.monolayer_factors[layer % self.n_monolayers] * np.exp(1j * np.dot(self.G, shift))
+
+    def step(self, changed, coverages):
+        """
+        Sets the coverages of the changed layers and updates the amplitudes with their coverage differences only. Returns the N intensities.
+        """
+        changed = np.asarray(changed, dtype = int)
+        if len(changed) > 0 and (changed.min() < 0 or changed.max() >= self.n_layers):
+            raise Errors.WrongGrowthLayer(changed, self.n_layers)
+        missing = changed[~ self.computed[changed]]
+        for layer in missing:
+            self.contributions[layer] = self._get_contribution_(layer)
+        self.computed[missing] = True
+        differences = np.asarray(coverages, dtype = float) - self.coverages[changed]
+        self.amplitudes += np.dot(differences, self.contributions[changed])
+        self.coverages[changed] = coverages
+        return self.amplitudes.real ** 2 + self.amplitudes.imag ** 2
+
+    def run(self, model, n_steps = None):
+        """
+        Generator of the (N,) intensities after every step of the growth model, an iterable of (changed layers, coverages) items like the ones of
+        layer_by_layer, distributed_growth and step_flow.
+        """
+        for index, (changed, coverages) in enumerate(model):
+            if n_steps is not None and index >= n_steps:
+                break
+            yield self.step(changed, coverages)
+
+    def write(self, model, filename, n_steps, flush_every = 1024):
+        """
+        Runs n_steps steps of the growth model appending the intensities to a memory-mapped (n_steps, N) .npy array. Returns the number of steps done.
+        """
+        intensities = np.lib.format.open_memmap(filename, mode = 'w+', dtype = np.float64, shape = (n_steps, len(self.G)))
+        steps = 0
+        for steps, values in enumerate(self.run(model, n_steps), 1):
+            intensities[steps - 1] = values
+            if steps % flush_every == 0:
+                intensities.flush()
+        intensities.flush()
+        return steps
+
+def specular_reflections(qz):
+    """
+    (N,3) reflections on the specular rod for the given perpendicular momentum transfers (in Angstrom^-1).
+    """
+    qz = np.atleast_1d(np.asarray(qz, dtype = float))
+    return np.stack((np.zeros_like(qz), np.zeros_like(qz), qz), axis = 1)
+
+def lattice_growth(lattice, G, n_layers, substrate_attenuation = 0.99):
+    """
+    Growth simulation of a film with the hkl oriented cell (rotAmat) and base (rotbase_coordinates) of a Lattice.
+    """
+    return Growth(lattice.rotAmat, lattice.rotbase_coordinates, lattice.base_species, lattice.species_table, G, n_layers, substrate_attenuation)
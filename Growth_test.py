@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import Errors
+import Growth
+import Lattice
+
+def replay(model, n_layers):
+    coverages = np.zeros(n_layers)
+    for changed, values in model:
+        coverages[changed] = values
+        yield coverages.copy()
+
+@pytest.mark.parametrize('rate, n_layers, n_steps', [(0.1, 3, 30), (0.3, 3, 10), (0.7, 5, 8), (1., 4, 4)])
+def test_layer_by_layer_steps(rate, n_layers, n_steps):
+    history = list(replay(Growth.layer_by_layer(rate, n_layers), n_layers))
+    assert len(history) == n_steps
+    assert np.allclose([np.sum(coverages) for coverages in history], np.minimum(rate * np.arange(1, n_steps + 1), n_layers))
+    assert np.all(history[-1] == 1.)
+
+@pytest.mark.parametrize('rate, terraces', [(0.25, 4), (0.3, 2.5), (1.5, 3)])
+def test_step_flow_coverages(rate, terraces):
+    n_layers = 10
+    layers = np.arange(n_layers)
+    history = list(replay(Growth.step_flow(rate, terraces, n_layers), n_layers))
+    heights = np.minimum(rate * np.arange(1, len(history) + 1), n_layers)
+    assert np.isclose(heights[-1], n_layers) and not np.isclose(heights[-2], n_layers)
+    for height, coverages in zip(heights, history):
+        assert np.allclose(coverages, np.clip(1. - (layers - height) / terraces, 0., 1.))
+
+def silicon_growth(n_layers, substrate_attenuation = 0.9):
+    lattice = Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], [1, 1, 1], 'p-1X1-R0')
+    G = np.vstack((Growth.specular_reflections(np.linspace(0.5, 5., 12)), np.dot([[1, 0, 1], [0, 1, 2]], lattice.rotBmat)))
+    return Growth.lattice_growth(lattice, G, n_layers, substrate_attenuation)
+
+def test_incremental_amplitudes():
+    growth = silicon_growth(12)
+    substrate = growth.amplitudes.copy()
+    for index, intensities in enumerate(growth.run(Growth.distributed_growth(0.05, 0.5, 12), 150)):
+        if index % 30 == 0:
+            layers = np.arange(growth.n_layers)
+            expected = substrate + np.sum([growth.coverages[layer] * growth._get_contribution_(layer) for layer in layers], axis = 0)
+            assert np.allclose(growth.amplitudes, expected, rtol = 10 ** (-10), atol = 10 ** (-10))
+            assert np.allclose(intensities, np.abs(expected) ** 2, rtol = 10 ** (-10), atol = 10 ** (-10))
+    assert 0. < growth.coverages.sum() < growth.n_layers and np.all(np.diff(growth.coverages) <= 0.)
+
+def test_substrate_amplitudes():
+    growth = silicon_growth(4, 0.9)
+    assert growth.n_monolayers > 1
+    # Layer l < 0 lies -l monolayers deep: truncated explicit sum over the substrate layers.
+    explicit = np.sum([0.9 ** (- layer) * growth._get_contribution_(layer) for layer in range(-1, -600, -1)], axis = 0)
+    assert np.allclose(growth.amplitudes, explicit, rtol = 10 ** (-10), atol = 10 ** (-10))
+    assert np.all(silicon_growth(4, 0.).amplitudes == 0.)
+
+@pytest.mark.parametrize('changed', [[-1], [12], [3, 12]])
+def test_wrong_growth_layer(changed):
+    growth = silicon_growth(12)
+    with pytest.raises(Errors.WrongGrowthLayer):
+        growth.step(changed, np.full(len(changed), 0.5))
+    assert np.all(growth.coverages == 0.)
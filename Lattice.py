@@ -1,30 +1,32 @@
 import numpy as np
-import pymatgen as mg
-import numpy.ma as ma
-from scipy import linalg
-import warnings
-import copy
-#import General
+import General
 import Errors
+import Symmetry
+import Reconstruction
+import Timings
 
 class Lattice():
     def __init__(self, space_group, lattice_parameters, elements, coordinates, miller_indexes,reconstruction):
+        self.timings = Timings.Timings() if Timings.is_active() else None
         space_group_number, a, b, c, alpha, beta, gamma = self._define_parameters_(space_group, lattice_parameters)
-        lattice = mg.Lattice.from_parameters(a, b, c, alpha, beta, gamma)
-        latticeAmat = ma.masked_inside(lattice.matrix,-10 ** (-15), 10 ** (-15)).filled(0.)
-        latticeBmat = ma.masked_inside(lattice.reciprocal_lattice.matrix,-10 ** (-15), 10 ** (-15)).filled(0.)
+        self.space_group_number = space_group_number
+        with Timings.stage(self.timings, 'lattice'):
+            lattice_matrix = General.lattice_matrix(a, b, c, alpha, beta, gamma)
+            self.Amat = General._clean_(lattice_matrix)
+            self.Bmat = General._clean_(2 * np.pi * np.transpose(np.linalg.inv(lattice_matrix)))
         elements_list = self._define_elements_(elements)
         coordinates_list = self._define_coordinates_(coordinates)
-        crystal = mg.Structure.from_spacegroup(space_group, lattice, elements_list,coordinates_list)
-        self._define_base_(crystal.sites)
-        #self.kvec = np.dot(np.array(miller_indexes),self.Bmat)
-        #self._get_hkl_oriented_lattice_(self.kvec)
-        #self.reconstruction_string = reconstruction
-        #self._get_surface_(self.Amat, self.reconstruction_string)
+        with Timings.stage(self.timings, 'symmetry_expansion'):
+            fractional_coordinates, sites_elements = Symmetry.expansion_cache.expand(space_group, elements_list, coordinates_list)
+        self._define_base_(np.dot(fractional_coordinates, lattice_matrix), sites_elements)
+        self.kvec = np.dot(np.array(miller_indexes),self.Bmat)
+        self._get_hkl_oriented_lattice_(self.kvec)
+        self._get_surface_(self.rotAmat, reconstruction)
 
+    @Timings.timed('parameters')
     def _define_parameters_(self, space_group, parameters):
         if type(space_group) == str:
-            space_group_number = mg.symmetry.groups.SpaceGroup(space_group).int_number
+            space_group_number = Symmetry.space_group_number(space_group)
         else:
             space_group_number = space_group
         if type(parameters) == float:
@@ -42,8 +44,8 @@ class Lattice():
                         beta = parameters_list[4]
                         gamma = parameters_list[5]
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 6)
-                except Errors.Wrongparameters_listNumber() as error:
+                        raise Errors.WrongParametersNumber(len(parameters_list), 6)
+                except Errors.WrongParametersNumber as error:
                     error.error_handler()
             elif space_group_number < 16:
                 try:
@@ -55,8 +57,8 @@ class Lattice():
                         beta = parameters_list[3]
                         gamma = 90.
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 4)
-                except Errors.Wrongparameters_listNumber() as error:
+                        raise Errors.WrongParametersNumber(len(parameters_list), 4)
+                except Errors.WrongParametersNumber as error:
                     error.error_handler()
             elif space_group_number < 75:
                 try:
@@ -68,9 +70,9 @@ class Lattice():
                         beta = 90.
                         gamma = 90.
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 3)
-                except Errors.Wrongparameters_listNumber() as error:
-                    error.error_handler
+                        raise Errors.WrongParametersNumber(len(parameters_list), 3)
+                except Errors.WrongParametersNumber as error:
+                    error.error_handler()
             elif space_group_number < 143:
                 try:
                     if len(parameters_list) == 2:
@@ -81,8 +83,8 @@ class Lattice():
                         beta = 90.
                         gamma = 90.
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 2)
-                except Errors.Wrongparameters_listNumber as error:
+                        raise Errors.WrongParametersNumber(len(parameters_list), 2)
+                except Errors.WrongParametersNumber as error:
                     error.error_handler()
             elif space_group_number < 168:
                 try:
@@ -94,8 +96,8 @@ class Lattice():
                         beta = parameters_list[2]
                         gamma = parameters_list[3]
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 4)
-                except Errors.Wrongparameters_listNumber() as error:
+                        raise Errors.WrongParametersNumber(len(parameters_list), 4)
+                except Errors.WrongParametersNumber as error:
                     error.error_handler()
             elif space_group_number < 195:
                 try:
@@ -107,8 +109,8 @@ class Lattice():
                         beta = 90.
                         gamma = 120.
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 2)
-                except Errors.Wrongparameters_listNumber() as error:
+                        raise Errors.WrongParametersNumber(len(parameters_list), 2)
+                except Errors.WrongParametersNumber as error:
                     error.error_handler()
             elif space_group_number < 231:
                 try:
@@ -120,8 +122,8 @@ class Lattice():
                         beta = 90.
                         gamma = 90.
                     else:
-                        raise Errors.Wrongparameters_listNumber(len(parameters_list), 1)
-                except Errors.Wrongparameters_listNumber as error:
+                        raise Errors.WrongParametersNumber(len(parameters_list), 1)
+                except Errors.WrongParametersNumber as error:
                     error.error_handler()
             else:
                 raise Errors.WrongLatticeSimmetry(space_group_number)
@@ -131,100 +133,126 @@ class Lattice():
 
     def _define_elements_(self, elements):
         if type(elements) == str:
-            elements_list = [mg.Element(elements)]
+            elements_list = [elements]
         else:
-            elements_list = [mg.Element(elements[0])]
-            for i in range(1,len(elements)):
-                elements_list += mg.Element(elements[i])
+            elements_list = [str(element) for element in elements]
         return elements_list
 
     def _define_coordinates_(self, coordinates):
-        if len(coordinates) == 3:
-            coordinates_list = [np.array(coordinates)]
-        else:
-            coordinates_list = [np.array(coordinates[0])]
-            for i in range(1,len(coordinates)):
-                coordinates_list = np.append(coordinates_list,np.array(coordinates[i]),axis = 1)
-        return coordinates_list
+        return np.array(coordinates, dtype = float).reshape(-1, 3)
 
-    def _define_base_(self, sites):
-        base = {}
-        for site in sites:
-            base[sites.index(site)] = {'Element': site.species.elements[0], 'Coordinates': ma.masked_less_equal(site.coords,10 ** (-15)).filled(0.)}
-        self.base = base
+    @Timings.timed('base')
+    def _define_base_(self, coordinates, elements):
+        species_codes = {}
+        species = np.empty(len(elements), dtype = np.int16)
+        for i, element in enumerate(elements):
+            species[i] = species_codes.setdefault(element, len(species_codes))
+        self.species_table = tuple(species_codes)
+        self.base_species = self._read_only_(species)
+        self.base_coordinates = self._read_only_(General._clean_(np.array(coordinates, dtype = np.float64)))
+        self._base = None
 
-    def _get_hkl_oriented_lattice_(self,kvec):
-        if np.all(np.cross(kvec, np.array([0., 0., 1.])) == np.array([0., 0., 0.])):
-            self.rotation_matrix = np.eye(3)
-            self.rotAmat = self.Amat
-            self.rotBmat = self.Bmat
-            self.rotbase = self.base
-        else:
-            warnings.simplefilter("ignore")
-            theta = - np.arctan(kvec[1] / kvec[0])
-            phi = - np.arctan(np.sqrt(kvec[0] ** 2 + kvec[1] ** 2) / kvec[2])
-            rthetaz = ma.masked_inside(ma.masked_equal(np.array([[np.cos(theta), -np.sin(theta), 0.],[np.sin(theta), np.cos(theta), 0.],[0., 0., 1.]]),-0.).filled(0.),-10 ** (-15),10 ** (-15)).filled(0.)
-            rphiy = ma.masked_inside(ma.masked_equal(np.array([[np.cos(phi), 0., np.sin(phi)],[0., 1., 0.],[-np.sin(phi), 0., np.cos(phi)]]),-0.).filled(0.),-10 ** (-15),10 ** (-15)).filled(0.)
-            matrix = np.dot(rphiy, rthetaz)
-            rotkvec = ma.masked_inside(np.dot(matrix,kvec),-10 ** (-15),10 ** (-15)).filled(0.)
-            Amattoreduce = np.dot(self.Amat, matrix)
-            Ap, Al, Au = linalg.lu(Amattoreduce)
-            Bmattoreduce = np.dot(self.Bmat, matrix)
-            Bp, Bl, Bu = linalg.lu(Bmattoreduce)
-            if np.all(np.cross(rotkvec, np.array([0., 0., 1.])) == np.array([0., 0., 0.])):
-                self.rotation_matrix = matrix
-                self.rotAmat = self._correct_u_matrices_(Au)
-                self.rotBmat = self._correct_u_matrices_(Bu)
-                self.rotbase = self._get_hkl_oriented_base_(matrix,self.base)
+    def _read_only_(self, array):
+        array.setflags(write = False)
+        return array
 
-    def _correct_u_matrices_(self, matrix):
-        corrected_matrix = []
-        for row in matrix:
-            if (row[0] < 0. or (row[0] == 0. and row[1] < 0.) or (row[0] == 0. and row[1] == 0. and row[2] < 0.)):
-                corrected_matrix.append(ma.masked_equal(-row,-0.).filled(0.))
-            else:
-                corrected_matrix.append(row)
-        return np.array(corrected_matrix)
+    def _base_dictionary_(self, coordinates):
+        import pymatgen.core as mg
+        species_elements = [mg.Element(symbol) for symbol in self.species_table]
+        return {i: {'Element': species_elements[self.base_species[i]], 'Coordinates': coordinates[i]} for i in range(len(coordinates))}
 
-    def _get_hkl_oriented_base_(self, rotation_matrix, base):
-        rotated_base = copy.deepcopy(base)
-        for key in base:
-            vector = ma.masked_inside(np.dot(rotation_matrix,base[key]["Coordinates"]),-10 ** (-15),10 ** (-15)).filled(0.)
-            rotated_base[key]["Coordinates"] = self._check_base_coordinates_(vector)
-        return rotated_base
+    @property
+    def base(self):
+        if self._base is None:
+            self._base = self._base_dictionary_(self.base_coordinates)
+        return self._base
 
-    def _check_base_coordinates_(self, vector):
-        if vector[0] < 0:
-            vector = vector + self.rotAmat[0]
-            self._check_base_coordinates_(vector)
-        elif vector[0] > self.rotAmat[0,0]:
-            vector = vector - self.rotAmat[0]
-            self._check_base_coordinates_(vector)
-        if vector[1] < 0:
-            vector = vector + self.rotAmat[1]
-            self._check_base_coordinates_(vector)
-        elif vector[1] > self.rotAmat[1,1]:
-            vector = vector - self.rotAmat[1]
-            self._check_base_coordinates_(vector)
-        if vector[2] < 0:
-            vector = vector + self.rotAmat[2]
-            self._check_base_coordinates_(vector)
-        elif vector[2] > self.rotAmat[2,2]:
-            vector = vector - self.rotAmat[2]
-            self._check_base_coordinates_(vector)
-        if (vector >= 0.).all() and (vector <= np.array([self.rotAmat[0,0],self.rotAmat[1,1],self.rotAmat[2,2]])).all():
-            return np.array(vector)
-        else:
-            self._check_base_coordinates_(vector)
+    @property
+    def rotbase(self):
+        if self._rotbase is None:
+            self._rotbase = self._base_dictionary_(self.rotbase_coordinates)
+        return self._rotbase
+
+    def save(self, filename):
+        """
+        Writes the built lattice in a versioned binary file, loaded back without pymatgen by LatticeFile.load_lattice.
+        """
+        import LatticeFile
+        LatticeFile.save_lattice(self, filename)
 
+    @Timings.timed('orientation')
+    def _get_hkl_oriented_lattice_(self,kvec):
+        oriented = self._get_hkl_oriented_lattices_(np.reshape(kvec, (1, 3)))
+        if oriented['oriented'][0]:
+            self.rotation_matrix = oriented['rotation_matrix'][0]
+            self.rotAmat = oriented['rotAmat'][0]
+            self.rotBmat = oriented['rotBmat'][0]
+            self.rotbase_coordinates = self._read_only_(oriented['rotbase_coordinates'][0])
+            self._rotbase = None
+        return bool(oriented['oriented'][0])
+
+    @Timings.timed('orientation')
+    def get_hkl_oriented_lattices(self, miller_indexes):
+        """
+        Orients the crystal to every one of the (N,3) Miller indexes at once (e.g. General.miller_indexes(5) for every surface up to index 5), without
+        changing the lattice. Returns a dictionary of stacked arrays: the miller_indexes, their kvec, the (N,3,3) rotation_matrix, rotAmat and rotBmat,
+        the (N,M,3) rotbase_coordinates and the (N,) oriented mask, False where the orientation fails (the other arrays are then meaningless).
+        """
+        miller_indexes = np.array(miller_indexes, dtype = float).reshape(-1, 3)
+        oriented = self._get_hkl_oriented_lattices_(np.dot(miller_indexes, self.Bmat))
+        oriented['miller_indexes'] = miller_indexes
+        return oriented
+
+    def _get_hkl_oriented_lattices_(self, kvecs):
+        """
+        Vectorized orientation of the lattice to the (N,3) kvecs: the rotations (around z by theta, then around y by phi) bringing every kvec along z,
+        the rotated cells and the rotated bases wrapped into them. rotAmat is a basis of the rotated lattice (an integer unimodular change of the basis
+        Amat, see General.surface_matrices) whose first two vectors span the surface mesh (z = 0) and whose third vector goes up by one interplanar
+        spacing, in general obliquely; rotBmat is its reciprocal basis.
+        """
+        along_z = np.all(kvecs[:, :2] == 0., axis = 1) & (kvecs[:, 2] > 0.)
+        # theta turns the in plane component of kvec onto +x, phi then brings kvec onto +z (never -z, so that (h,k,l) and (-h,-k,-l) give the two
+        # opposite faces of the crystal).
+        theta = - np.arctan2(kvecs[:, 1], kvecs[:, 0])
+        phi = - np.arctan2(np.hypot(kvecs[:, 0], kvecs[:, 1]), kvecs[:, 2])
+        theta, phi = np.where(along_z, 0., theta), np.where(along_z, 0., phi)
+        matrices = np.matmul(General.rotation_matrices_y_axis(phi), General.rotation_matrices_z_axis(theta))
+        rotkvecs = General._clean_(np.einsum('nij,nj->ni', matrices, kvecs))
+        oriented = along_z | (np.linalg.norm(rotkvecs[:, :2], axis = 1) <= 10 ** (-10) * np.linalg.norm(kvecs, axis = 1))
+        with Timings.stage(self.timings, 'cell_reduction'):
+            miller_indexes = np.dot(kvecs, np.transpose(self.Amat)) / (2 * np.pi)
+            integers = np.round(miller_indexes)
+            oriented &= np.all(np.abs(miller_indexes - integers) < 10 ** (-6), axis = 1) & np.any(integers != 0., axis = 1)
+            integers = np.where(oriented[:, np.newaxis], integers, [0., 0., 1.]).astype(np.int64)
+            integers //= np.gcd.reduce(integers, axis = 1)[:, np.newaxis]
+            cells = np.matmul(np.matmul(General.surface_matrices(integers), self.Amat), np.swapaxes(matrices, -1, -2))
+            rotAmats = General.reduce_surface_cells(cells)
+            rotAmats[along_z] = self.Amat
+            rotBmats = General._clean_(2 * np.pi * np.swapaxes(np.linalg.inv(rotAmats), -1, -2))
+            rotBmats[along_z] = self.Bmat
+        rotated = General._clean_(np.matmul(self.base_coordinates, np.swapaxes(matrices, -1, -2)))
+        fractional = np.mod(np.matmul(rotated, np.linalg.inv(rotAmats)), 1.)
+        fractional[fractional > 1. - 10 ** (-10)] = 0.
+        rotbase_coordinates = General._clean_(np.matmul(fractional, rotAmats))
+        rotbase_coordinates[along_z] = self.base_coordinates
+        return {'kvec': kvecs, 'rotation_matrix': matrices, 'rotAmat': rotAmats, 'rotBmat': rotBmats, 'rotbase_coordinates': rotbase_coordinates, 'oriented': oriented}
+
+    @Timings.timed('surface')
     def _get_surface_(self, lattice, reconstruction):
-        string_split = reconstruction.split('-')
-        theta = float(string_split[2][1:])
-        periodicities = string_split[1].split('X')
-        p1, p2 = tuple([float(periodicities[0]),float(periodicities[1])])
-        if string_split[0] == 'p':
-            self.Woodsmatrix = ma.masked_inside(np.array([[np.cos(theta), - np.sin(theta)],[np.sin(theta), np.cos(theta)]]) * np.array([[p1, 0.],[0.,p2]]) * np.eye(2),-10 ** (-15),10 ** (-15)).filled(0.)
-        else:
-            self.Woodsmatrix = ma.masked_inside(np.array([[np.cos(theta), - np.sin(theta)],[np.sin(theta), np.cos(theta)]]) * np.array([[p1, 0.],[0.,p2]]) * np.array([[1., 0.],[0.5, 0.5]]),-10 ** (-15),10 ** (-15)).filled(0.)
-        self.surfAmat = ma.masked_inside(self.Woodsmatrix * np.dot(np.array([[1., 0., 0.],[0., 1., 0.]]),np.dot(self.Amat, np.array([[1., 0.],[0., 1.],[0., 0.]]))),-10 ** (-15),10 ** (-15)).filled(0.)
-        self.surfBmat = ma.masked_inside(2 * np.pi * np.transpose(linalg.inv(self.surfAmat)),-10 ** (-15),10 ** (-15)).filled(0.)
\ No newline at end of file
+        """
+        Reconstructed surface mesh of the in plane cell of lattice, with the reconstruction in Wood's notation (angles in degrees) or matrix notation,
+        and its domains: the symmetry distinct images of the mesh under the in plane point group of the substrate, with their weights. lattice must be
+        in the frame of the hkl oriented crystal (rotAmat, whose first two vectors span the surface mesh), where the point group is brought by
+        rotation_matrix.
+        """
+        substrate = np.array(lattice)[:2, :2]
+        operations = Reconstruction.surface_point_group(Symmetry.cartesian_point_group(self.space_group_number, self.Amat), getattr(self, 'rotation_matrix', None), substrate)
+        try:
+            self.reconstruction = Reconstruction.Reconstruction(reconstruction, substrate, operations)
+        except Errors.ReconstructionErrors as error:
+            error.error_handler()
+        self.Woodsmatrix = self.reconstruction.matrix
+        self.surfAmat = General._clean_(self.reconstruction.surfAmat)
+        self.surfBmat = General._clean_(self.reconstruction.surfBmat)
+        self.domain_matrices = self.reconstruction.domain_matrices
+        self.domain_weights = self.reconstruction.domain_weights
@@ -0,0 +1,141 @@
+import json
+import struct
+import threading
+import numpy as np
+import Errors
+import Lattice
+
+# File layout: magic, format version and header length (little endian uint32), the JSON header, then the raw arrays, every one aligned to alignment
+# bytes at the offset listed in the header. The same layout is used for shared memory blocks.
+magic = b'RHEEDLAT'
+version = 1
+alignment = 64
+_prefix = struct.Struct('<8sII')
+_attached = {}
+_attach_lock = threading.Lock()
+
+array_names = ('Amat', 'Bmat', 'kvec', 'rotation_matrix', 'rotAmat', 'rotBmat', 'base_coordinates', 'base_species', 'rotbase_coordinates', 'Woodsmatrix', 'surfAmat', 'surfBmat', 'domain_matrices', 'domain_weights')
+
+def _aligned_(size):
+    return - (- size // alignment) * alignment
+
+def _layout_(lattice):
+    """
+    Header bytes (prefix included, padded to the alignment), the (array, offset) pairs and the total size of the serialized lattice. Only the
+    attributes the lattice actually has are stored.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(lattice, name)) for name in array_names if getattr(lattice, name, None) is not None}
+    reconstruction = getattr(lattice, 'reconstruction', None)
+    notation = None if reconstruction is None else reconstruction.notation
+    attributes = {'space_group_number': int(lattice.space_group_number), 'species_table': list(lattice.species_table), 'reconstruction': notation if isinstance(notation, (str, type(None))) else np.asarray(notation).tolist()}
+    offset = 0
+    entries = {}
+    for name, array in arrays.items():
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned_(offset + array.nbytes)
+    header = json.dumps({'arrays': entries, 'attributes': attributes}).encode()
+    header_size = _aligned_(_prefix.size + len(header))
+    prefix = _prefix.pack(magic, version, len(header)) + header
+    return prefix + b'\0' * (header_size - len(prefix)), [(array, header_size + entries[name]['offset']) for name, array in arrays.items()], header_size + offset
+
+def _write_(lattice, buffer):
+    header, arrays, size = _layout_(lattice)
+    buffer[:len(header)] = np.frombuffer(header, dtype = np.uint8)
+    for array, offset in arrays:
+        buffer[offset:offset + array.nbytes] = np.frombuffer(array.tobytes(), dtype = np.uint8)
+
+def _read_(buffer, source):
+    """
+    Lattice whose arrays are views on the uint8 buffer (a memory-mapped file or a shared memory block): nothing is copied and pymatgen is not needed.
+    """
+    if len(buffer) < _prefix.size:
+        raise Errors.WrongLatticeFile(source, 'the file is truncated')
+    file_magic, file_version, header_length = _prefix.unpack(bytes(buffer[:_prefix.size]))
+    if file_magic != magic:
+        raise Errors.WrongLatticeFile(source, 'it is not a serialized lattice')
+    if file_version != version:
+        raise Errors.WrongLatticeFile(source, 'its format version is {0}, while version {1} is supported'.format(file_version, version))
+    header = json.loads(bytes(buffer[_prefix.size:_prefix.size + header_length]).decode())
+    header_size = _aligned_(_prefix.size + header_length)
+    lattice = Lattice.Lattice.__new__(Lattice.Lattice)
+    lattice.timings = None
+    lattice._base = None
+    lattice._rotbase = None
+    lattice.reconstruction = None
+    lattice.space_group_number = header['attributes']['space_group_number']
+    lattice.species_table = tuple(header['attributes']['species_table'])
+    lattice.reconstruction_notation = header['attributes']['reconstruction']
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        start = header_size + entry['offset']
+        size = int(np.prod(entry['shape'])) * dtype.itemsize
+        if start + size > len(buffer):
+            raise Errors.WrongLatticeFile(source, 'the file is truncated')
+        array = buffer[start:start + size].view(dtype).reshape(entry['shape'])
+        array.setflags(write = False)
+        setattr(lattice, name, array)
+    return lattice
+
+def save_lattice(lattice, filename):
+    """
+    Writes the matrices (Amat, Bmat, the oriented and surface ones, the rotation and Wood's matrices), the base arrays and the domains of a Lattice in
+    a single versioned binary file.
+    """
+    size = _layout_(lattice)[2]
+    buffer = np.memmap(filename, dtype = np.uint8, mode = 'w+', shape = (size,))
+    _write_(lattice, buffer)
+    buffer.flush()
+
+def load_lattice(filename, mmap = True):
+    """
+    Reads a Lattice written by save_lattice. With mmap = True the arrays are read-only views on the memory-mapped file, so that any number of
+    processes loading the same file share its pages; otherwise the file is read into memory. The lattice is not rebuilt: the Reconstruction object
+    is not restored (reconstruction is None, its notation is in reconstruction_notation), the surface and domain arrays are.
+    """
+    buffer = np.memmap(filename, dtype = np.uint8, mode = 'r') if mmap else np.fromfile(filename, dtype = np.uint8)
+    return _read_(buffer, filename)
+
+def lattice_to_shared_memory(lattice, name = None):
+    """
+    Copies a Lattice, in the save_lattice layout, into a new multiprocessing shared memory block and returns the block: workers attach to it by name
+    with lattice_from_shared_memory. The caller owns the block and must close() and unlink() it when the workers are done.
+    """
+    from multiprocessing import shared_memory
+    size = _layout_(lattice)[2]
+    block = shared_memory.SharedMemory(name = name, create = True, size = size)
+    _write_(lattice, np.ndarray((size,), dtype = np.uint8, buffer = block.buf))
+    return block
+
+def _attach_(name):
+    # The attaching process must not track the block: a resource tracker of its own would unlink it (and warn about a leak) when the process exits.
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)
+    except TypeError:
+        with _attach_lock:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                return shared_memory.SharedMemory(name = name)
+            finally:
+                resource_tracker.register = register
+
+def lattice_from_shared_memory(name):
+    """
+    Lattice whose arrays are views on the shared memory block with the given name (see lattice_to_shared_memory). The block is attached once per
+    process and stays open, whatever happens to the lattices loaded from it, until detach(name); it is not tracked, so that only the creating process
+    unlinks it.
+    """
+    block = _attached.get(name)
+    if block is None:
+        block = _attached[name] = _attach_(name)
+    return _read_(np.ndarray((block.size,), dtype = np.uint8, buffer = block.buf), name)
+
+def detach(name):
+    """
+    Closes the shared memory block with the given name in this process. The lattices loaded from it, and any array taken from them, must be deleted
+    first.
+    """
+    block = _attached.pop(name, None)
+    if block is not None:
+        block.close()
@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import Errors
+import Lattice
+import LatticeFile
+
+def silicon():
+    return Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], [0, 0, 1], 'p-2X1-R0')
+
+def _worker_(name):
+    lattice = LatticeFile.lattice_from_shared_memory(name)
+    return np.asarray(lattice.Amat).tolist(), np.asarray(lattice.rotbase_coordinates).tolist(), lattice.species_table
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_file_round_trip(tmp_path, mmap):
+    lattice = silicon()
+    lattice.save(str(tmp_path / 'si.lat'))
+    loaded = LatticeFile.load_lattice(str(tmp_path / 'si.lat'), mmap)
+    for name in LatticeFile.array_names:
+        if hasattr(lattice, name):
+            assert np.array_equal(getattr(loaded, name), getattr(lattice, name)), name
+    assert loaded.species_table == lattice.species_table and loaded.space_group_number == 227
+
+def test_wrong_file(tmp_path):
+    (tmp_path / 'wrong.lat').write_bytes(b'x' * 64)
+    with pytest.raises(Errors.WrongLatticeFile):
+        LatticeFile.load_lattice(str(tmp_path / 'wrong.lat'))
+
+def test_shared_memory_views_outlive_the_lattice():
+    block = LatticeFile.lattice_to_shared_memory(silicon())
+    try:
+        Amat = LatticeFile.lattice_from_shared_memory(block.name).Amat
+        assert np.array_equal(Amat, silicon().Amat)
+        del Amat
+        LatticeFile.detach(block.name)
+    finally:
+        block.close()
+        block.unlink()
+
+def test_shared_memory_in_spawned_workers():
+    lattice = silicon()
+    block = LatticeFile.lattice_to_shared_memory(lattice)
+    try:
+        with multiprocessing.get_context('spawn').Pool(2) as pool:
+            results = pool.map(_worker_, [block.name] * 4)
+        for Amat, rotbase_coordinates, species_table in results:
+            assert np.array_equal(Amat, lattice.Amat) and np.array_equal(rotbase_coordinates, lattice.rotbase_coordinates) and species_table == ('Si',)
+        # A process with a resource tracker of its own must neither unlink the block nor report it as leaked when it exits.
+        code = 'import LatticeFile; print(LatticeFile.lattice_from_shared_memory({0!r}).Amat.sum())'.format(block.name)
+        worker = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, cwd = os.path.dirname(os.path.abspath(LatticeFile.__file__)))
+        assert worker.returncode == 0 and 'leaked' not in worker.stderr, worker.stderr
+        LatticeFile.detach(block.name)
+        assert np.array_equal(LatticeFile.lattice_from_shared_memory(block.name).Amat, lattice.Amat)
+        LatticeFile.detach(block.name)
+    finally:
+        block.close()
+        block.unlink()
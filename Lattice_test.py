@@ -1,11 +1,81 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import General
 import Lattice
+import StructureFactor
 
-lattice = Lattice.Lattice(227,5.43,"Si",[0,0,0],[1,0,0],"p-2X1-R0")
-print(lattice.base)
-#print(lattice.kvec)
-#print(lattice.rotAmat)
-#print(lattice.rotBmat)
-#print(lattice.rotbase)
-#print(lattice.Woodsmatrix)
-#print(lattice.surfAmat)
-#print(lattice.surfBmat)
\ No newline at end of file
+# Cold import of Lattice and first Si construction in a fresh interpreter, numpy import excluded: numpy alone takes 80-90 ms on a typical machine
+# and is out of reach, the rest must stay well below it.
+budget = 0.05
+cold_start = """
+import sys, time
+import numpy
+start = time.perf_counter()
+import Lattice
+lattice = Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], [1, 0, 0], 'p-2X1-R0')
+print(time.perf_counter() - start, len(lattice.base_coordinates), *[name in sys.modules for name in ('pymatgen', 'numpy.ma', 'cProfile', 'tracemalloc')])
+"""
+
+def test_construction():
+    lattice = Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], [1, 0, 0], 'p-2X1-R0')
+    assert len(lattice.base_coordinates) == 8 and lattice.species_table == ('Si',)
+
+def test_cold_start_budget():
+    durations = []
+    for run in range(3):
+        output = subprocess.run([sys.executable, '-c', cold_start], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, check = True).stdout.split()
+        assert output[1:] == ['8', 'False', 'False', 'False', 'False']
+        durations.append(float(output[0]))
+    print('Cold import and construction: {0:.1f} ms'.format(min(durations) * 1000))
+    assert min(durations) < budget
+
+@pytest.mark.parametrize('miller_indexes', [[1, 1, 1], [2, 1, 1], [1, 1, 0], [0, 0, 1], [3, 2, 1], [-1, 2, 0], [1, -1, -1], [-1, -1, -1], [0, 0, -1], [-1, 0, 0]])
+def test_oriented_cell_is_a_lattice_basis(miller_indexes, gallium_arsenide):
+    lattice = gallium_arsenide(miller_indexes)
+    T = np.dot(lattice.rotAmat, np.linalg.inv(np.dot(lattice.Amat, np.transpose(lattice.rotation_matrix))))
+    assert np.allclose(T, np.round(T), atol = 10 ** (-8)) and np.isclose(abs(np.linalg.det(T)), 1.)
+    assert np.allclose(lattice.rotAmat[:2, 2], 0.) and lattice.rotAmat[2, 2] > 0.
+    assert np.allclose(np.dot(lattice.rotation_matrix, lattice.kvec)[:2], 0.) and np.dot(lattice.rotation_matrix, lattice.kvec)[2] > 0.
+    assert np.isclose(lattice.rotAmat[2, 2], 2 * np.pi / np.linalg.norm(lattice.kvec))
+    assert np.allclose(np.dot(lattice.rotAmat, np.transpose(lattice.rotBmat)), 2 * np.pi * np.eye(3))
+
+@pytest.mark.parametrize('miller_indexes', [[1, 1, 1], [2, 1, 1]])
+def test_orientation_keeps_intensities(miller_indexes, gallium_arsenide):
+    lattice = gallium_arsenide(miller_indexes)
+    G = np.dot([[1, 1, 1], [2, 2, 0], [0, 0, 4], [3, 1, 1], [2, 0, 2], [1, 3, 5]], lattice.Bmat)
+    before = StructureFactor.StructureFactor(lattice.base_coordinates, lattice.base_species, lattice.species_table).intensities(G)
+    after = StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table).intensities(np.dot(G, np.transpose(lattice.rotation_matrix)))
+    assert np.allclose(after, before)
+
+def test_polar_faces_differ(gallium_arsenide):
+    # (111) and (-1-1-1) are the two opposite faces: the As layer lies 3/4 and 1/4 of the interplanar spacing above the Ga layer.
+    spacings = []
+    for miller_indexes in ([1, 1, 1], [-1, -1, -1]):
+        lattice = gallium_arsenide(miller_indexes)
+        heights = lattice.rotbase_coordinates[:, 2]
+        spacings.append((heights[lattice.base_species == 1][0] - heights[lattice.base_species == 0][0]) % lattice.rotAmat[2, 2] / lattice.rotAmat[2, 2])
+    assert np.allclose(spacings, [0.75, 0.25])
+    G = np.dot([[1, 1, 1], [2, 2, 2], [3, 3, 3]], gallium_arsenide([1, 1, 1]).Bmat)
+    amplitudes = [StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table).compute(np.dot(G * sign, np.transpose(lattice.rotation_matrix))) for sign, lattice in ((1, gallium_arsenide([1, 1, 1])), (-1, gallium_arsenide([-1, -1, -1])))]
+    assert np.allclose(np.abs(amplitudes[0]), np.abs(amplitudes[1])) and not np.allclose(amplitudes[0], amplitudes[1])
+
+def test_batched_orientation_matches_single(gallium_arsenide):
+    miller_indexes = General.miller_indexes(2)
+    lattice = gallium_arsenide([0, 0, 1])
+    oriented = lattice.get_hkl_oriented_lattices(miller_indexes)
+    assert np.all(oriented['oriented'])
+    for i in range(0, len(miller_indexes), 7):
+        single = gallium_arsenide(miller_indexes[i])
+        for name in ('rotation_matrix', 'rotAmat', 'rotBmat', 'rotbase_coordinates'):
+            assert np.allclose(oriented[name][i], getattr(single, name)), name
+
+@pytest.mark.parametrize('miller_indexes, n_operations, n_domains', [([0, 0, 1], 8, 2), ([1, 1, 0], 4, 1), ([1, 1, 1], 6, 3)])
+def test_surface_domains(miller_indexes, n_operations, n_domains):
+    lattice = Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], miller_indexes, 'p-2X1-R0')
+    assert np.allclose(lattice.surfAmat, np.dot(lattice.Woodsmatrix, lattice.rotAmat[:2, :2]))
+    assert np.allclose(np.dot(lattice.surfAmat, np.transpose(lattice.surfBmat)), 2 * np.pi * np.eye(2))
+    assert len(lattice.reconstruction.operations) == n_operations and lattice.reconstruction.n_domains == n_domains
+    assert np.isclose(np.sum(lattice.domain_weights), 1.)
@@ -0,0 +1,156 @@
+import json
+import os
+import numpy as np
+import Lattice
+import Pattern
+import StructureFactor
+
+descriptor_options = {'azimuthal_range': (-8., 8.), 'polar_range': (0., 8.), 'azimuthal_bins': 16, 'polar_bins': 8}
+
+def _soft_histogram_(values, weights, value_range, bins):
+    # Linear interpolation of every value between the two closest bin centers, so that descriptors change smoothly with the spot positions.
+    position = (values - value_range[0]) / (value_range[1] - value_range[0]) * bins - 0.5
+    inside = np.isfinite(position) & (position > -1.) & (position < bins) & (weights > 0.)
+    position = np.where(inside, position, 0.)
+    lower = np.floor(position).astype(np.int64)
+    fraction = position - lower
+    entries = np.broadcast_to(np.arange(values.shape[0])[:, np.newaxis], values.shape)
+    histogram = np.zeros(values.shape[0] * (bins + 2))
+    for bin_index, bin_weight in ((lower + 1, 1. - fraction), (lower + 2, fraction)):
+        histogram += np.bincount((entries * (bins + 2) + bin_index)[inside], weights = (weights * bin_weight)[inside], minlength = len(histogram))
+    return histogram.reshape(values.shape[0], bins + 2)[:, 1:-1]
+
+def spot_descriptors(polar, azimuthal, intensities, azimuthal_range = (-8., 8.), polar_range = (0., 8.), azimuthal_bins = 16, polar_bins = 8):
+    """
+    Fixed length descriptors of E spot lists, given as (E, S) arrays of exit angles (in degrees, NaN for missing spots) and intensities: the
+    square root intensity weighted histograms of the azimuthal and of the polar exit angles, concatenated and normalized to unit length. Returns an
+    (E, azimuthal_bins + polar_bins) float32 array.
+    """
+    polar, azimuthal = np.atleast_2d(polar), np.atleast_2d(azimuthal)
+    weights = np.sqrt(np.clip(np.nan_to_num(np.broadcast_to(intensities, polar.shape)), 0., None))
+    weights = np.where(np.isfinite(polar) & np.isfinite(azimuthal), weights, 0.)
+    descriptors = np.concatenate((_soft_histogram_(azimuthal, weights, azimuthal_range, azimuthal_bins), _soft_histogram_(polar, weights, polar_range, polar_bins)), axis = 1)
+    norms = np.linalg.norm(descriptors, axis = 1, keepdims = True)
+    return (descriptors / np.where(norms > 0., norms, 1.)).astype(np.float32)
+
+def _brightest_spots_(polar, azimuthal, intensities, n_spots):
+    # Keeps the n_spots brightest visible spots of every pattern, padding with NaN angles and zero intensities.
+    intensities = np.where(np.isfinite(polar), intensities, -1.)
+    order = np.argsort(- intensities, axis = 1, kind = 'stable')[:, :n_spots]
+    polar, azimuthal, intensities = [np.take_along_axis(array, order, axis = 1) for array in (polar, azimuthal, intensities)]
+    missing = intensities < 0.
+    spots = np.stack((np.where(missing, np.nan, polar), np.where(missing, np.nan, azimuthal), np.where(missing, 0., intensities)), axis = -1)
+    if spots.shape[1] < n_spots:
+        padding = np.zeros((spots.shape[0], n_spots - spots.shape[1], 3))
+        padding[..., :2] = np.nan
+        spots = np.concatenate((spots, padding), axis = 1)
+    return spots
+
+def _material_patterns_(lattice, miller, reconstruction, energy, incidence, azimuths, order):
+    """
+    Exit angles and kinematic intensities of the hkl oriented, reconstructed lattice for all the azimuths, as (azimuths, rods) arrays, or None when
+    the orientation of miller fails.
+    """
+    if not lattice._get_hkl_oriented_lattice_(np.dot(miller, lattice.Bmat)):
+        return None
+    lattice._get_surface_(lattice.rotAmat, reconstruction)
+    scan = Pattern.AzimuthalScan(lattice.surfBmat, energy, incidence, azimuths, order)
+    polar, azimuthal = scan._get_exit_angles_()
+    structure_factor = StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table)
+    G = np.concatenate((np.broadcast_to(np.dot(scan.hk, scan.surfBmat), scan.qz.shape + (2,)), scan.qz[..., np.newaxis]), axis = -1)
+    intensities = np.where(scan.visible, structure_factor.intensities(G.reshape(-1, 3)).reshape(scan.qz.shape), 0.)
+    return polar.reshape(len(azimuths), -1), azimuthal.reshape(len(azimuths), -1), intensities.reshape(len(azimuths), -1)
+
+def build_library(directory, materials, miller_indexes, azimuths, reconstructions, energy, incidence, order = 10, n_spots = 32, progress = None):
+    """
+    Precomputes the patterns of every material (a dict {name: {'space_group': ..., 'lattice_parameters': ..., 'elements': ..., 'coordinates': ...}},
+    as the Sweep jobs), Miller index, reconstruction and azimuth (in degrees) at the given beam energy (eV) and incidence angle (degrees), and writes
+    them in directory as memory-mapped .npy arrays: the descriptors, the n_spots brightest spots (polar, azimuthal, intensity) of every entry and the
+    indexes of its material, orientation, reconstruction and azimuth. Orientations that cannot be built are skipped and listed in library.json.
+    Returns the PatternLibrary.
+    """
+    os.makedirs(directory, exist_ok = True)
+    azimuths = np.atleast_1d(np.asarray(azimuths, dtype = float))
+    miller_indexes = np.array(miller_indexes, dtype = int).reshape(-1, 3)
+    names = list(materials)
+    combinations = [(m, o, r) for m in range(len(names)) for o in range(len(miller_indexes)) for r in range(len(reconstructions))]
+    n_entries = len(combinations) * len(azimuths)
+    arrays = {'descriptors': ((sum(descriptor_options[key] for key in ('azimuthal_bins', 'polar_bins')),), np.float32), 'spots': ((n_spots, 3), np.float32), 'keys': ((4,), np.int32)}
+    files = {name: np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode = 'w+', dtype = dtype, shape = (n_entries,) + shape) for name, (shape, dtype) in arrays.items()}
+    lattices = {}
+    skipped = []
+    entries = 0
+    for done, (m, o, r) in enumerate(combinations, 1):
+        if m not in lattices:
+            material = materials[names[m]]
+            lattices[m] = Lattice.Lattice(material['space_group'], material['lattice_parameters'], material['elements'], material['coordinates'], [0, 0, 1], 'p-1X1-R0')
+        patterns = _material_patterns_(lattices[m], miller_indexes[o], reconstructions[r], energy, incidence, azimuths, order)
+        if patterns is None:
+            skipped.append({'material': names[m], 'miller_indexes': miller_indexes[o].tolist()})
+        else:
+            polar, azimuthal, intensities = patterns
+            rows = slice(entries, entries + len(azimuths))
+            files['descriptors'][rows] = spot_descriptors(polar, azimuthal, intensities, **descriptor_options)
+            files['spots'][rows] = _brightest_spots_(polar, azimuthal, intensities, n_spots)
+            files['keys'][rows] = np.column_stack((np.full(len(azimuths), m), np.full(len(azimuths), o), np.full(len(azimuths), r), np.arange(len(azimuths))))
+            entries += len(azimuths)
+        if progress is not None:
+            progress(done, len(combinations))
+    for array in files.values():
+        array.flush()
+    header = {'version': 1, 'entries': entries, 'materials': names, 'miller_indexes': miller_indexes.tolist(), 'reconstructions': list(reconstructions), 'azimuths': azimuths.tolist(), 'energy': energy, 'incidence': incidence, 'order': order, 'descriptor_options': descriptor_options, 'skipped': skipped}
+    with open(os.path.join(directory, 'library.json'), 'w') as header_file:
+        json.dump(header, header_file, indent = 1)
+    return PatternLibrary(directory)
+
+class PatternLibrary():
+    def __init__(self, directory, leafsize = 32):
+        """
+        Pattern library written by build_library. The arrays are memory-mapped, so opening a library is immediate and its pages are shared between
+        processes; the k-d tree over the descriptors (scipy.spatial.cKDTree) is built on the first query.
+        """
+        self.directory = directory
+        self.leafsize = leafsize
+        with open(os.path.join(directory, 'library.json')) as header_file:
+            self.header = json.load(header_file)
+        entries = self.header['entries']
+        self.descriptors = np.load(os.path.join(directory, 'descriptors.npy'), mmap_mode = 'r')[:entries]
+        self.spots = np.load(os.path.join(directory, 'spots.npy'), mmap_mode = 'r')[:entries]
+        self.keys = np.load(os.path.join(directory, 'keys.npy'), mmap_mode = 'r')[:entries]
+        self._tree = None
+
+    def __len__(self):
+        return len(self.descriptors)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.descriptors, leafsize = self.leafsize, balanced_tree = False, compact_nodes = False)
+        return self._tree
+
+    def entry(self, index):
+        m, o, r, a = (int(key) for key in self.keys[index])
+        return {'index': int(index), 'material': self.header['materials'][m], 'miller_indexes': self.header['miller_indexes'][o], 'reconstruction': self.header['reconstructions'][r], 'azimuth': self.header['azimuths'][a], 'spots': np.array(self.spots[index])}
+
+    def query_descriptors(self, descriptors, k = 5, eps = 0.):
+        """
+        (Q, k) distances and entry indexes of the k nearest library entries to every one of the Q descriptors. eps > 0 allows approximate neighbours
+        within a (1 + eps) factor of the true distances, which makes queries faster.
+        """
+        distances, indexes = self.tree.query(np.atleast_2d(descriptors), k = k, eps = eps)
+        return distances.reshape(-1, k), indexes.reshape(-1, k)
+
+    def query(self, polar, azimuthal, intensities, k = 5, eps = 0.):
+        """
+        The k best matches of a measured spot list (exit angles in degrees and intensities), as a list of entries with their descriptor distance.
+        """
+        descriptor = spot_descriptors(np.reshape(polar, (1, -1)), np.reshape(azimuthal, (1, -1)), np.reshape(intensities, (1, -1)), **self.header['descriptor_options'])
+        distances, indexes = self.query_descriptors(descriptor, k, eps)
+        matches = []
+        for distance, index in zip(distances[0], indexes[0]):
+            if index < len(self):
+                match = self.entry(index)
+                match['distance'] = float(distance)
+                matches.append(match)
+        return matches
@@ -0,0 +1,48 @@
+import json
+import os
+import numpy as np
+import pytest
+import Library
+
+pytest.importorskip('scipy.spatial')
+
+materials = {'Si': {'space_group': 227, 'lattice_parameters': 5.43, 'elements': 'Si', 'coordinates': [0, 0, 0]}, 'GaAs': {'space_group': 216, 'lattice_parameters': 5.6533, 'elements': ['Ga', 'As'], 'coordinates': [[0, 0, 0], [0.25, 0.25, 0.25]]}}
+miller_indexes = [[0, 0, 1], [1, 1, 1], [0, 0, 0], [1, 1, 0]]
+azimuths = [0., 10., 25.]
+
+@pytest.fixture(scope = 'module')
+def library(tmp_path_factory):
+    return Library.build_library(str(tmp_path_factory.mktemp('library')), materials, miller_indexes, azimuths, ['p-1X1-R0'], 15000., 2., order = 4, n_spots = 81)
+
+def test_library_header(library):
+    assert len(library) == 2 * 3 * len(azimuths)
+    with open(os.path.join(library.directory, 'library.json')) as header_file:
+        header = json.load(header_file)
+    assert header['skipped'] == [{'material': 'Si', 'miller_indexes': [0, 0, 0]}, {'material': 'GaAs', 'miller_indexes': [0, 0, 0]}]
+    assert header['materials'] == ['Si', 'GaAs'] and header['miller_indexes'] == miller_indexes and header['azimuths'] == azimuths
+    assert not np.any(np.all(np.array(miller_indexes)[library.keys[:, 1]] == 0, axis = 1))
+
+def test_query_own_spots(library):
+    for index in range(len(library)):
+        entry = library.entry(index)
+        polar, azimuthal, intensities = np.transpose(entry['spots'])
+        matches = library.query(polar, azimuthal, intensities, k = 3)
+        assert matches[0]['index'] == index and matches[0]['distance'] < 10 ** (-5)
+        assert (matches[0]['material'], matches[0]['miller_indexes'], matches[0]['azimuth']) == (entry['material'], entry['miller_indexes'], entry['azimuth'])
+
+def test_reopen_maps_descriptors(library):
+    reopened = Library.PatternLibrary(library.directory)
+    assert isinstance(reopened.descriptors.base, np.memmap) or isinstance(reopened.descriptors, np.memmap)
+    assert np.array_equal(reopened.descriptors, library.descriptors) and np.array_equal(reopened.keys, library.keys)
+    assert np.array_equal(reopened.spots, library.spots, equal_nan = True)
+    assert reopened.header == library.header
+
+def test_spot_descriptors():
+    polar = np.array([[1., 2., np.nan], [1., 2., 30.]])
+    azimuthal = np.array([[0., 1., 0.], [0., 1., 100.]])
+    descriptors = Library.spot_descriptors(polar, azimuthal, [[4., 1., 9.], [4., 1., 9.]])
+    # A spot outside the ranges counts as a missing one, and descriptors are unit vectors.
+    assert descriptors.shape == (2, 24) and np.allclose(np.linalg.norm(descriptors, axis = 1), 1.)
+    assert np.allclose(descriptors[0], descriptors[1])
+    spots = Library._brightest_spots_(polar, azimuthal, np.array([[4., 1., 9.], [4., 1., 9.]]), 4)
+    assert spots.shape == (2, 4, 3) and np.allclose(spots[1, :3, 2], [9., 4., 1.]) and np.isnan(spots[0, 2:, 0]).all() and np.all(spots[0, 2:, 2] == 0.)
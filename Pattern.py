@@ -0,0 +1,116 @@
+import numpy as np
+import General
+import Errors
+
+planck_constant = 6.62607015e-34
+electron_mass = 9.1093837015e-31
+elementary_charge = 1.602176634e-19
+speed_of_light = 299792458.
+
+def electron_wavelength(energy):
+    """
+    Relativistic de Broglie wavelength (in Angstrom) of an electron accelerated by the given beam energy (in eV). Works elementwise on arrays.
+    """
+    energy = np.asarray(energy, dtype = float)
+    if np.any(energy <= 0.):
+        raise Errors.WrongBeamEnergy(energy)
+    momentum = np.sqrt(2. * electron_mass * elementary_charge * energy * (1. + elementary_charge * energy / (2. * electron_mass * speed_of_light ** 2)))
+    return planck_constant / momentum * 10 ** 10
+
+def electron_wavevector(energy):
+    """
+    Modulus of the electron wavevector (in Angstrom^-1, 2*pi convention, the same used by Bmat and surfBmat) for the given beam energy (in eV).
+    """
+    return 2 * np.pi / electron_wavelength(energy)
+
+def rod_indexes(order):
+    """
+    Returns the (N,2) integer array of all the (h,k) rod indexes with |h| and |k| not larger than order.
+    """
+    h, k = np.mgrid[-order:order + 1, -order:order + 1]
+    return np.stack((h.ravel(), k.ravel()), axis = 1)
+
+def incident_wavevector(k, incidence, azimuth):
+    """
+    Incident wavevector for a beam of modulus k impinging at the given glancing incidence angle and azimuth (both in degrees, measured from the surface
+    plane and from the first surface lattice vector respectively). Arrays of angles are broadcast together and the result has shape (..., 3).
+    """
+    theta = np.radians(incidence)
+    phi = np.radians(azimuth)
+    k, theta, phi = np.broadcast_arrays(k, theta, phi)
+    return np.stack((k * np.cos(theta) * np.cos(phi), k * np.cos(theta) * np.sin(phi), - k * np.sin(theta)), axis = -1)
+
+def ewald_rod_intersections(rods, kin):
+    """
+    Intersects every reciprocal rod with the Ewald sphere in a single array operation.
+    rods is the (N,2) array of in plane rod positions (or a (..., N, 2) stack of them, broadcast against kin), kin the (..., 3) array of incident
+    wavevectors. Returns the outgoing wavevectors with shape (..., N, 3), the perpendicular momentum transfer qz with shape (..., N) and the boolean mask
+    of the rods that actually cut the sphere above the surface.
+    """
+    kin = np.asarray(kin, dtype = float)
+    k2 = np.einsum('...i,...i->...', kin, kin)[..., np.newaxis]
+    kx = kin[..., np.newaxis, 0] + rods[..., 0]
+    ky = kin[..., np.newaxis, 1] + rods[..., 1]
+    kz2 = k2 - kx ** 2 - ky ** 2
+    visible = kz2 >= 0.
+    kz = np.sqrt(np.where(visible, kz2, 0.))
+    qz = kz - kin[..., np.newaxis, 2]
+    return np.stack((kx, ky, kz), axis = -1), qz, visible
+
+class KinematicPattern():
+    def __init__(self, surfBmat, energy, incidence, azimuth = 0., order = 10, hk = None):
+        self.surfBmat = np.asarray(surfBmat, dtype = float)
+        self.energy = energy
+        self.incidence = np.asarray(incidence, dtype = float)
+        self.azimuth = np.asarray(azimuth, dtype = float)
+        if hk is None:
+            self.hk = rod_indexes(order)
+        else:
+            self.hk = np.asarray(hk).reshape(-1, 2)
+        self.k = electron_wavevector(energy)
+        self.rods = np.dot(self.hk, self.surfBmat)
+        self.beam_azimuth = self.azimuth
+        self.kin = incident_wavevector(self.k, self.incidence, self.azimuth)
+        self.kout, self.qz, self.visible = ewald_rod_intersections(self.rods, self.kin)
+
+    def _get_exit_angles_(self):
+        k = np.linalg.norm(self.kin, axis = -1)[..., np.newaxis]
+        polar = np.degrees(np.arcsin(np.clip(self.kout[..., 2] / k, -1., 1.)))
+        azimuthal = np.degrees(np.arctan2(self.kout[..., 1], self.kout[..., 0])) - self.beam_azimuth[..., np.newaxis]
+        # Relative to the beam and wrapped into (-180, 180], as the azimuths of AzimuthalScan, whose beam is along x.
+        azimuthal = 180. - np.mod(180. - azimuthal, 360.)
+        return np.where(self.visible, polar, np.nan), np.where(self.visible, azimuthal, np.nan)
+
+    def spots(self, index = None):
+        """
+        Returns (hk, qz, polar exit angle, azimuthal exit angle) of the visible rods, for the given incidence/azimuth index when the pattern was built on
+        an array of angles.
+        """
+        polar, azimuthal = self._get_exit_angles_()
+        if index is None:
+            visible, qz = self.visible, self.qz
+        else:
+            visible, qz, polar, azimuthal = self.visible[index], self.qz[index], polar[index], azimuthal[index]
+        return self.hk[np.nonzero(visible)[-1]], qz[visible], polar[visible], azimuthal[visible]
+
+class AzimuthalScan(KinematicPattern):
+    def __init__(self, surfBmat, energy, incidence, azimuths, order = 10, hk = None):
+        """
+        Full azimuthal scan: the beam is kept along x and the surface reciprocal lattice is rotated through all the given azimuths (in degrees) at once,
+        with a stack of rotation matrices. Every array attribute has the azimuths as leading axis, so pattern i is the one of KinematicPattern with
+        azimuth azimuths[i]. incidence can be a scalar or an array with one angle per azimuth.
+        """
+        self.surfBmat = np.asarray(surfBmat, dtype = float)
+        self.energy = energy
+        self.azimuth = np.atleast_1d(np.asarray(azimuths, dtype = float)).ravel()
+        self.incidence = np.broadcast_to(np.asarray(incidence, dtype = float), self.azimuth.shape)
+        if hk is None:
+            self.hk = rod_indexes(order)
+        else:
+            self.hk = np.asarray(hk).reshape(-1, 2)
+        self.k = electron_wavevector(energy)
+        rotations = General.rotation_matrices_z_axis(- np.radians(self.azimuth))[:, :2, :2]
+        self.rods = np.einsum('aij,nj->ani', rotations, np.dot(self.hk, self.surfBmat))
+        self.beam_azimuth = np.zeros_like(self.azimuth)
+        self.kin = incident_wavevector(self.k, self.incidence, self.beam_azimuth)
+        self.kout, self.qz, self.visible = ewald_rod_intersections(self.rods, self.kin)
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+import Pattern
+
+surfBmat = 2 * np.pi / 3.84 * np.eye(2)
+
+@pytest.mark.parametrize('azimuth', [0., 45., 170., 190., -175., 350., 720.])
+def test_exit_azimuths_are_wrapped(azimuth):
+    hk, qz, polar, azimuthal = Pattern.KinematicPattern(surfBmat, 15000., 2., azimuth, 6).spots()
+    assert np.all((azimuthal > -180.) & (azimuthal <= 180.))
+    assert np.isclose(azimuthal[np.all(hk == 0, axis = 1)][0], 0., atol = 10 ** (-9))
+    scan = Pattern.AzimuthalScan(surfBmat, 15000., 2., [azimuth], 6).spots(0)
+    assert np.array_equal(hk, scan[0]) and np.allclose(azimuthal, scan[3]) and np.allclose(polar, scan[2])
@@ -0,0 +1,141 @@
+import re
+import numpy as np
+import Pattern
+import Errors
+
+_factor = r'((?:√|SQRT)?\(?[\d.]+\)?)'
+_woods_notation = re.compile(r'^([PC])?-?\(?' + _factor + r'X' + _factor + r'\)?-?(?:R(-?[\d.]+))?$')
+_number = re.compile(r'-?\d+(?:\.\d*)?(?:/\d+)?')
+
+def _factor_value_(factor):
+    value = float(re.search(r'[\d.]+', factor).group())
+    return np.sqrt(value) if factor.startswith(('√', 'SQRT')) else value
+
+def _fraction_value_(number):
+    numerator, _, denominator = number.partition('/')
+    return float(numerator) / float(denominator or 1.)
+
+def _clean_(matrix, tolerance = 10 ** (-6)):
+    # Commensurate reconstructions have integer matrices: snap the entries that are integers up to rounding errors.
+    rounded = np.round(matrix)
+    return np.where(np.abs(matrix - rounded) < tolerance, rounded, matrix) + 0.
+
+def woods_matrix(p1, p2, theta, centered, substrate):
+    """
+    Matrix M of the (p1 x p2)R(theta) Wood's reconstruction (theta in degrees, counterclockwise) of the substrate mesh (2x2, vectors as rows), such
+    that the reconstructed mesh is M . substrate. For a centered c(p1 x p2) mesh the primitive vectors b1 and (b1 + b2) / 2 are used.
+    """
+    substrate = np.asarray(substrate, dtype = float)
+    angle = np.radians(theta)
+    rotation = np.array([[np.cos(angle), - np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    mesh = np.array([p1, p2])[:, np.newaxis] * np.dot(substrate, rotation.T)
+    if centered:
+        mesh = np.dot(np.array([[1., 0.], [0.5, 0.5]]), mesh)
+    return _clean_(np.dot(mesh, np.linalg.inv(substrate)))
+
+def parse_reconstruction(notation, substrate):
+    """
+    Reconstruction matrix of the given notation on the substrate mesh. Accepted notations are:
+    - Wood's notation, as the historical "p-2X1-R0" / "c-4X2-R0" strings or as "(2x1)", "c(4×2)", "√3×√3-R30°", "(sqrt3 x sqrt3)R30", with the rotation
+      angle in degrees;
+    - matrix notation, as a 2x2 array or as a string with four numbers like "(2 1, -1 1)" or "[[2, 1], [-1, 1]]".
+    """
+    if not isinstance(notation, str):
+        matrix = np.array(notation, dtype = float)
+        if matrix.shape != (2, 2):
+            raise Errors.WrongReconstructionNotation(notation)
+        return _clean_(matrix)
+    string = notation.upper().replace(' ', '').replace('×', 'X').replace('*', 'X').replace('°', '')
+    match = _woods_notation.match(string)
+    if match is not None:
+        centered, p1, p2, theta = match.groups()
+        return woods_matrix(_factor_value_(p1), _factor_value_(p2), float(theta or 0.), centered == 'C', substrate)
+    numbers = _number.findall(notation)
+    if 'X' not in string and len(numbers) == 4:
+        return _clean_(np.array([_fraction_value_(number) for number in numbers]).reshape(2, 2))
+    raise Errors.WrongReconstructionNotation(notation)
+
+def surface_point_group(operations, rotation_matrix = None, substrate = None, tolerance = 10 ** (-6)):
+    """
+    (P,2,2) in plane point group of the surface: the cartesian point operations of the crystal (as returned by Symmetry.cartesian_point_group), brought
+    to the frame of the oriented crystal by rotation_matrix, that leave the surface normal (z) unchanged. When the substrate mesh is given, only the
+    operations mapping it onto itself are kept.
+    """
+    operations = np.asarray(operations, dtype = float)
+    if rotation_matrix is not None:
+        operations = np.matmul(np.matmul(rotation_matrix, operations), np.transpose(rotation_matrix))
+    planar = operations[np.abs(operations[:, 2, 2] - 1.) < tolerance][:, :2, :2]
+    if substrate is not None:
+        substrate = np.asarray(substrate, dtype = float)
+        integers = np.matmul(np.matmul(substrate, np.swapaxes(planar, -1, -2)), np.linalg.inv(substrate))
+        planar = planar[np.all(np.abs(integers - np.round(integers)) < tolerance, axis = (1, 2))]
+    flat = np.round(planar.reshape(len(planar), 4) / tolerance) * tolerance
+    return planar[np.sort(np.unique(flat, axis = 0, return_index = True)[1])]
+
+class Reconstruction():
+    def __init__(self, notation, substrate, operations = None, tolerance = 10 ** (-6)):
+        """
+        Reconstruction of the substrate mesh (2x2, cartesian vectors as rows) given in Wood's or matrix notation (see parse_reconstruction), and its
+        domains. Every in plane point operation of the substrate (operations, (P,2,2), e.g. from surface_point_group; only the identity by default)
+        maps the reconstructed mesh onto a domain; the images that span the same mesh are the same domain, which is kept once with a weight equal to
+        the fraction of the operations giving it, so that domain averages cost one evaluation per distinct domain instead of one per operation.
+        """
+        self.notation = notation
+        self.substrate = np.array(substrate, dtype = float)
+        self.tolerance = tolerance
+        self.matrix = parse_reconstruction(notation, self.substrate)
+        if abs(np.linalg.det(self.matrix)) < tolerance:
+            raise Errors.SingularReconstructionMatrix(self.matrix)
+        self.surfAmat = np.dot(self.matrix, self.substrate)
+        self.surfBmat = 2 * np.pi * np.transpose(np.linalg.inv(self.surfAmat))
+        self.operations = np.eye(2)[np.newaxis] if operations is None else np.asarray(operations, dtype = float).reshape(-1, 2, 2)
+        # The identity goes first, so that the first domain is the reconstruction as given.
+        identity = np.all(np.abs(self.operations - np.eye(2)) < tolerance, axis = (1, 2))
+        self.operations = self.operations[np.argsort(~ identity, kind = 'stable')]
+        self._define_domains_()
+
+    def _define_domains_(self):
+        meshes = np.matmul(self.surfAmat, np.swapaxes(self.operations, -1, -2))
+        representatives, counts = [], []
+        for index, mesh in enumerate(meshes):
+            for domain, representative in enumerate(representatives):
+                transformation = np.dot(mesh, np.linalg.inv(meshes[representative]))
+                if np.all(np.abs(transformation - np.round(transformation)) < self.tolerance) and abs(abs(np.linalg.det(transformation)) - 1.) < self.tolerance:
+                    counts[domain] += 1
+                    break
+            else:
+                representatives.append(index)
+                counts.append(1)
+        self.domain_operations = self.operations[representatives]
+        self.domain_surfAmats = meshes[representatives]
+        self.domain_surfBmats = 2 * np.pi * np.swapaxes(np.linalg.inv(self.domain_surfAmats), -1, -2)
+        self.domain_matrices = _clean_(np.matmul(self.domain_surfAmats, np.linalg.inv(self.substrate)), self.tolerance)
+        self.domain_weights = np.array(counts, dtype = float) / len(self.operations)
+        self.n_domains = len(representatives)
+
+    def rods(self, order = 10):
+        """
+        In plane reciprocal vectors (M,2) of the rods of all the domains, merged when several domains share a rod, with their weights (the summed
+        weights of the domains having the rod) and their fractional indexes on the substrate reciprocal mesh.
+        """
+        hk = Pattern.rod_indexes(order)
+        rods = np.matmul(hk, self.domain_surfBmats).reshape(-1, 2)
+        weights = np.repeat(self.domain_weights, len(hk))
+        keys = np.round(rods / self.tolerance ** 0.5).astype(np.int64)
+        keys, first, inverse = np.unique(keys, axis = 0, return_index = True, return_inverse = True)
+        merged_weights = np.bincount(inverse.reshape(-1), weights = weights)
+        substrate_Bmat = 2 * np.pi * np.transpose(np.linalg.inv(self.substrate))
+        merged_rods = rods[first]
+        return merged_rods, merged_weights, _clean_(np.dot(merged_rods, np.linalg.inv(substrate_Bmat)), self.tolerance ** 0.5)
+
+    def average(self, intensities, G):
+        """
+        Domain averaged intensities at the reciprocal vectors G (..., 2) or (..., 3). intensities(G) must compute the intensities of the reference
+        domain; the domain obtained with the operation g scatters at G as the reference one does at g^-1 G, so all the distinct domains are evaluated
+        in a single call on the stacked rotated vectors, and combined with their weights.
+        """
+        G = np.asarray(G, dtype = float)
+        rotated = np.broadcast_to(G, (self.n_domains,) + G.shape).copy()
+        rotated[..., :2] = np.matmul(G[np.newaxis, ..., :2].reshape(1, -1, 2), self.domain_operations).reshape(rotated[..., :2].shape)
+        values = np.asarray(intensities(rotated.reshape((-1,) + G.shape[-1:]))).reshape((self.n_domains,) + G.shape[:-1])
+        return np.tensordot(self.domain_weights, values, axes = 1)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import Errors
+import Reconstruction
+
+a = 3.84
+square = np.array([[a, 0.], [0., a]])
+hexagonal = np.array([[a, 0.], [a / 2, a * np.sqrt(3) / 2]])
+
+def rotation(degrees):
+    angle = np.radians(degrees)
+    return np.array([[np.cos(angle), - np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+
+def point_group(order):
+    # Rotations by multiples of 360 / order and the mirrors through them (p4m for order 4, p6m for order 6).
+    rotations = [rotation(360. * k / order) for k in range(order)]
+    return np.array(rotations + [np.dot(r, np.diag([1., -1.])) for r in rotations])
+
+@pytest.mark.parametrize('notation, substrate, matrix', [
+    ('p-2X1-R0', square, [[2, 0], [0, 1]]),
+    ('(2x1)', hexagonal, [[2, 0], [0, 1]]),
+    ('c(4×2)', square, [[4, 0], [2, 1]]),
+    ('c-4X2-R0', square, [[4, 0], [2, 1]]),
+    ('√3×√3-R30°', hexagonal, [[1, 1], [-1, 2]]),
+    ('(sqrt3 x sqrt3)R30', hexagonal, [[1, 1], [-1, 2]]),
+    ('(√2×√2)R45°', square, [[1, 1], [-1, 1]]),
+    ('(2 1, -1 1)', hexagonal, [[2, 1], [-1, 1]]),
+    ('[[2, 1], [-1, 1]]', square, [[2, 1], [-1, 1]]),
+    ('(1/2 0, 0 1)', square, [[0.5, 0], [0, 1]]),
+    ([[3, 0], [1, 2]], hexagonal, [[3, 0], [1, 2]])])
+def test_parse_reconstruction(notation, substrate, matrix):
+    assert np.array_equal(Reconstruction.parse_reconstruction(notation, substrate), matrix)
+
+@pytest.mark.parametrize('notation', ['2y1', 'p-2X-R0', '(1 2 3)', '(2 1, -1 1, 0)', [1, 2, 3], 'sqrt3'])
+def test_wrong_notation(notation):
+    with pytest.raises(Errors.WrongReconstructionNotation):
+        Reconstruction.parse_reconstruction(notation, square)
+
+def test_singular_matrix():
+    with pytest.raises(Errors.SingularReconstructionMatrix):
+        Reconstruction.Reconstruction('(1 1, 2 2)', square)
+
+def mesh_intensities(mesh):
+    # Intensities of a structure with the given mesh, invariant under every operation mapping the mesh onto itself: a lattice sum over the mesh
+    # points within 12 Angstrom, damped along the third component of G.
+    indexes = np.mgrid[-8:9, -8:9].reshape(2, -1).T
+    points = np.dot(indexes, mesh)
+    points = points[np.linalg.norm(points, axis = 1) < 12.]
+    def intensities(G):
+        F = np.exp(1j * np.dot(G[:, :2], points.T)).sum(axis = 1)
+        return np.abs(F) ** 2 * np.exp(- G[:, 2] ** 2)
+    return intensities
+
+@pytest.mark.parametrize('notation, substrate, order, n_domains', [('p-2X1-R0', hexagonal, 6, 3), ('c(4×2)', square, 4, 2), ('p-2X1-R0', square, 4, 2), ('√3×√3-R30°', hexagonal, 6, 1)])
+def test_domain_average(notation, substrate, order, n_domains):
+    operations = point_group(order)
+    reconstruction = Reconstruction.Reconstruction(notation, substrate, Reconstruction.surface_point_group(np.pad(operations, ((0, 0), (0, 1), (0, 1))) + np.diag([0., 0., 1.]), substrate = substrate))
+    assert reconstruction.n_domains == n_domains and np.isclose(reconstruction.domain_weights.sum(), 1.)
+    G = np.random.default_rng(1).uniform(-3., 3., (200, 3))
+    reference = mesh_intensities(reconstruction.surfAmat)
+    explicit = np.mean([reference(np.column_stack((np.dot(G[:, :2], operation), G[:, 2]))) for operation in reconstruction.operations], axis = 0)
+    assert len(reconstruction.operations) == 2 * order
+    assert np.allclose(reconstruction.average(reference, G), explicit, rtol = 10 ** (-10))
+
+def test_domain_rods():
+    reconstruction = Reconstruction.Reconstruction('p-2X1-R0', hexagonal, point_group(6))
+    rods, weights, indexes = reconstruction.rods(4)
+    # Integer rods are shared by the three domains, every half order rod belongs to one of them (within the radius reached by all the domains).
+    inside = np.linalg.norm(rods, axis = 1) < 3.
+    integer = np.all(indexes == np.round(indexes), axis = 1)
+    assert np.allclose(weights[inside & integer], 1.) and np.allclose(weights[inside & ~ integer], 1. / 3.)
+    assert np.allclose(indexes[~ integer] * 2, np.round(indexes[~ integer] * 2))
@@ -0,0 +1,152 @@
+import numpy as np
+import Pattern
+
+# Peak memory of a rendered frame, in bytes per pixel of the FFT padded frame: the float64 deposit, its complex transforms and the broadened copies
+# (about 24 measured, with some margin). scan_frames sizes its batches on it.
+frame_bytes = 32
+
+def gaussian_kernel(sigma):
+    """
+    Normalized 1D gaussian kernel with the given standard deviation (in pixels), truncated at 4 sigma. A zero sigma gives the identity kernel.
+    """
+    if sigma <= 0.:
+        return np.ones(1)
+    x = np.arange(- int(np.ceil(4 * sigma)), int(np.ceil(4 * sigma)) + 1)
+    kernel = np.exp(- 0.5 * (x / sigma) ** 2)
+    return kernel / kernel.sum()
+
+class Screen():
+    def __init__(self, camera_length, size, resolution, broadening = (0., 0.), streak_length = 0., horizon = 0.1):
+        """
+        Phosphor screen perpendicular to the beam, at camera_length (in mm) from the sample. size is the (width, height) of the screen in mm, resolution
+        its (columns, rows) in pixels. broadening is the (horizontal, vertical) standard deviation of the instrument response and streak_length the
+        length of the streaks along the rods, all in mm. horizon is the fraction of the screen height, from the bottom, where the sample surface plane
+        hits the screen.
+        Broadening is applied as a separable convolution done with FFTs, whose kernel transforms are computed once here.
+        """
+        self.camera_length = float(camera_length)
+        self.size = np.array(size, dtype = float)
+        self.resolution = np.array(resolution, dtype = int)
+        self.pixel_size = self.size / self.resolution
+        self.horizon = horizon
+        horizontal_kernel = gaussian_kernel(broadening[0] / self.pixel_size[0])
+        vertical_kernel = gaussian_kernel(broadening[1] / self.pixel_size[1])
+        streak_pixels = int(round(streak_length / self.pixel_size[1]))
+        if streak_pixels > 1:
+            vertical_kernel = np.convolve(vertical_kernel, np.ones(streak_pixels) / streak_pixels)
+        self._kernels_ = [self._kernel_transform_(horizontal_kernel, self.resolution[0]), self._kernel_transform_(vertical_kernel, self.resolution[1])]
+
+    def _kernel_transform_(self, kernel, length):
+        n = length + len(kernel) - 1
+        return np.fft.rfft(kernel, n), n, (len(kernel) - 1) // 2
+
+    def project(self, polar, azimuthal):
+        """
+        Pixel (row, column) positions of the reflections leaving the sample with the given polar and azimuthal exit angles (in degrees, the azimuth
+        measured from the beam direction), and the mask of the ones that hit the screen.
+        """
+        polar, azimuthal = np.radians(polar), np.radians(azimuthal)
+        with np.errstate(invalid = 'ignore'):
+            forward = np.cos(azimuthal) > 0.
+            horizontal = self.camera_length * np.tan(azimuthal)
+            vertical = self.camera_length * np.tan(polar) / np.cos(azimuthal)
+            columns = np.floor(horizontal / self.pixel_size[0] + self.resolution[0] / 2.)
+            rows = np.floor((1. - self.horizon) * self.resolution[1] - vertical / self.pixel_size[1])
+            on_screen = forward & (columns >= 0) & (columns < self.resolution[0]) & (rows >= 0) & (rows < self.resolution[1])
+        return np.where(on_screen, rows, 0).astype(np.intp), np.where(on_screen, columns, 0).astype(np.intp), on_screen
+
+    def deposit(self, polar, azimuthal, intensities = None):
+        """
+        Accumulates the reflections onto the pixel grid in one bincount. Angles (and intensities) have shape (F, N) for F frames of N reflections;
+        returns the (F, rows, columns) stack of unbroadened frames.
+        """
+        polar, azimuthal = np.atleast_2d(polar), np.atleast_2d(azimuthal)
+        intensities = np.ones(polar.shape) if intensities is None else np.broadcast_to(intensities, polar.shape)
+        rows, columns, on_screen = self.project(polar, azimuthal)
+        frames = np.broadcast_to(np.arange(polar.shape[0])[:, np.newaxis], polar.shape)
+        indexes = (frames * self.resolution[1] + rows) * self.resolution[0] + columns
+        images = np.bincount(indexes[on_screen], weights = intensities[on_screen], minlength = polar.shape[0] * self.resolution[1] * self.resolution[0])
+        return images.reshape(polar.shape[0], self.resolution[1], self.resolution[0])
+
+    def broaden(self, images):
+        """
+        Applies the instrument broadening and the streaks to a stack of frames with two FFT convolutions, along columns and along rows.
+        """
+        for axis, (transform, n, offset) in zip((-1, -2), self._kernels_):
+            length = images.shape[axis]
+            images = np.fft.irfft(np.fft.rfft(images, n, axis = axis) * (transform if axis == -1 else transform[:, np.newaxis]), n, axis = axis)
+            images = np.take(images, np.arange(offset, offset + length), axis = axis)
+        return images
+
+    def render(self, polar, azimuthal, intensities = None):
+        return self.broaden(self.deposit(polar, azimuthal, intensities))
+
+    def batch_size(self, memory_budget = 2 ** 28):
+        """
+        Number of frames that can be rendered together within memory_budget bytes, at least one: about frame_bytes times the padded pixels per frame,
+        i.e. 35 MB for a 1024 x 1024 screen, so that the default 256 MB budget gives batches of 7 frames.
+        """
+        pixels = self._kernels_[0][1] * self._kernels_[1][1]
+        return max(int(memory_budget // (frame_bytes * pixels)), 1)
+
+    def pattern_frames(self, patterns, intensities = None):
+        """
+        Generator of rendered frames, one per pattern in the iterable of KinematicPattern (or AzimuthalScan) objects. Patterns built on arrays of angles
+        give one frame per angle. intensities, if given, is called as intensities(pattern) and must return an array shaped as pattern.qz.
+        """
+        for pattern in patterns:
+            polar, azimuthal = pattern._get_exit_angles_()
+            weights = None if intensities is None else intensities(pattern)
+            polar, azimuthal = polar.reshape(-1, polar.shape[-1]), azimuthal.reshape(-1, azimuthal.shape[-1])
+            if weights is not None:
+                weights = np.broadcast_to(weights, pattern.qz.shape).reshape(polar.shape)
+            for frame in self.render(np.nan_to_num(polar, nan = -90.), np.nan_to_num(azimuthal, nan = 180.), weights):
+                yield frame
+
+    def scan_frames(self, surfBmat, energy, incidence, azimuths, order = 10, intensities = None, batch = None, memory_budget = 2 ** 28):
+        """
+        Generator of the frames of an azimuthal scan, computed batch azimuths at a time so that memory use does not depend on the number of frames.
+        By default the batch is the largest one that fits in memory_budget bytes (see batch_size).
+        """
+        azimuths = np.atleast_1d(azimuths)
+        if batch is None:
+            batch = self.batch_size(memory_budget)
+        patterns = (Pattern.AzimuthalScan(surfBmat, energy, incidence, azimuths[start:start + batch], order) for start in range(0, len(azimuths), batch))
+        return self.pattern_frames(patterns, intensities)
+
+def lattice_scan_frames(lattice, screen, energy, incidence, azimuths, order = 10, batch = None, memory_budget = 2 ** 28):
+    """
+    Frames of an azimuthal scan of a Lattice, using its surface reciprocal mesh (surfBmat) for the rods and its hkl oriented base (rotbase_coordinates,
+    whose surface normal is along z after the rotation to rotBmat) for the kinematic intensities.
+    """
+    import StructureFactor
+    structure_factor = StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table)
+    def intensities(pattern):
+        G = np.concatenate((np.broadcast_to(np.dot(pattern.hk, pattern.surfBmat), pattern.qz.shape + (2,)), pattern.qz[..., np.newaxis]), axis = -1)
+        return np.where(pattern.visible, structure_factor.intensities(G).reshape(pattern.qz.shape), 0.)
+    return screen.scan_frames(lattice.surfBmat, energy, incidence, azimuths, order, intensities, batch, memory_budget)
+
+def write_frames(frames, filename, n_frames, shape):
+    """
+    Streams frames into an on-disk (n_frames, rows, columns) stack without keeping them in memory: a memory-mapped .npy file, or a chunked HDF5
+    dataset named 'frames' when filename ends with .h5 or .hdf5 (this needs h5py). Returns the number of frames written.
+    """
+    if filename.endswith(('.h5', '.hdf5')):
+        import h5py
+        with h5py.File(filename, 'w') as output:
+            stack = output.create_dataset('frames', shape = (n_frames,) + tuple(shape), dtype = np.float32, chunks = (1,) + tuple(shape))
+            written = _write_frames_(frames, stack, n_frames)
+    else:
+        stack = np.lib.format.open_memmap(filename, mode = 'w+', dtype = np.float32, shape = (n_frames,) + tuple(shape))
+        written = _write_frames_(frames, stack, n_frames)
+        stack.flush()
+    return written
+
+def _write_frames_(frames, stack, n_frames):
+    written = 0
+    for frame in frames:
+        if written == n_frames:
+            break
+        stack[written] = frame
+        written += 1
+    return written
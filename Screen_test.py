@@ -0,0 +1,27 @@
+import tracemalloc
+import numpy as np
+import Screen
+
+surfBmat = 2 * np.pi / 3.84 * np.eye(2)
+
+def silicon_screen():
+    return Screen.Screen(300., (100., 80.), (512, 512), (0.3, 0.3), 2.)
+
+def test_scan_frames_fit_memory_budget():
+    screen = silicon_screen()
+    memory_budget = 2 ** 25
+    assert screen.batch_size(memory_budget) > 1
+    tracemalloc.start()
+    try:
+        n_frames = sum(1 for frame in screen.scan_frames(surfBmat, 15000., 2., np.arange(20.), memory_budget = memory_budget))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert n_frames == 20 and peak < memory_budget
+
+def test_scan_frames_do_not_depend_on_batch():
+    screen = silicon_screen()
+    single = list(screen.scan_frames(surfBmat, 15000., 2., np.arange(0., 50., 5.), batch = 1))
+    batched = list(screen.scan_frames(surfBmat, 15000., 2., np.arange(0., 50., 5.)))
+    assert len(single) == len(batched) == 10 and np.allclose(single, batched)
+    assert np.all([frame.sum() > 0. for frame in single])
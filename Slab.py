@@ -0,0 +1,63 @@
+import itertools
+import numpy as np
+import General
+import Errors
+
+translations_chunk_size = 2 ** 12
+
+def supercell_translations(supercell):
+    """
+    Returns the (|det M|, 2) integer array of the surface lattice translations that lie inside the supercell described by the 2x2 integer matrix M
+    (rows are the supercell vectors in units of the surface cell vectors), e.g. [[2,0],[0,1]] for a 2X1 or [[2,1],[-1,1]] for a sqrt3Xsqrt3-R30.
+    """
+    supercell = np.array(supercell, dtype = int).reshape(2, 2)
+    determinant = int(round(abs(np.linalg.det(supercell))))
+    if determinant == 0:
+        raise Errors.WrongSupercellMatrix(supercell)
+    corners = np.array(list(itertools.product([0, 1], repeat = 2))).dot(supercell)
+    i, j = np.mgrid[corners[:, 0].min():corners[:, 0].max() + 1, corners[:, 1].min():corners[:, 1].max() + 1]
+    candidates = np.stack((i.ravel(), j.ravel()), axis = 1)
+    fractional = np.dot(candidates, np.linalg.inv(supercell))
+    fractional[np.abs(fractional) < 10 ** (-10)] = 0.
+    inside = np.all((fractional >= 0.) & (fractional < 1. - 10 ** (-10)), axis = 1)
+    return candidates[inside]
+
+class Slab():
+    def __init__(self, Amat, coordinates, species, n_layers = 1, supercell = ((1, 0), (0, 1)), filename = None):
+        """
+        Builds the slab obtained by wrapping the base (coordinates, species) into the cell Amat, replicating it over the surface supercell and stacking
+        n_layers cells along the third lattice vector. When filename is given, positions are written block by block to a memory-mapped .npy file instead
+        of being allocated in RAM.
+        """
+        self.cellAmat = np.array(Amat, dtype = float)
+        self.supercell = np.array(supercell, dtype = int).reshape(2, 2)
+        self.n_layers = int(n_layers)
+        base_coordinates = General.wrap_into_cell(np.asarray(coordinates, dtype = float).reshape(-1, 3), self.cellAmat)
+        base_species = np.asarray(species, dtype = np.int16).reshape(-1)
+        self.Amat = np.vstack((np.dot(self.supercell, self.cellAmat[:2]), self.n_layers * self.cellAmat[2]))
+        in_plane = supercell_translations(self.supercell)
+        layers = np.arange(self.n_layers)
+        cells = np.hstack((np.repeat(in_plane, len(layers), axis = 0), np.tile(layers, len(in_plane))[:, np.newaxis]))
+        translations = np.dot(cells, self.cellAmat)
+        self.n_cells = len(translations)
+        self.n_atoms = self.n_cells * len(base_coordinates)
+        self.species = np.tile(base_species, self.n_cells)
+        self._build_coordinates_(base_coordinates, translations, filename)
+
+    def _build_coordinates_(self, base_coordinates, translations, filename):
+        if filename is None:
+            self.coordinates = np.empty((self.n_atoms, 3))
+        else:
+            self.coordinates = np.lib.format.open_memmap(filename, mode = 'w+', dtype = np.float64, shape = (self.n_atoms, 3))
+        n_base = len(base_coordinates)
+        for start in range(0, self.n_cells, translations_chunk_size):
+            block = translations[start:start + translations_chunk_size]
+            self.coordinates[start * n_base:(start + len(block)) * n_base] = (block[:, np.newaxis, :] + base_coordinates[np.newaxis, :, :]).reshape(-1, 3)
+        if filename is not None:
+            self.coordinates.flush()
+
+def lattice_slab(lattice, n_layers = 1, supercell = ((1, 0), (0, 1)), filename = None):
+    """
+    Slab built from the hkl oriented cell (rotAmat) and base (rotbase_coordinates) of a Lattice.
+    """
+    return Slab(lattice.rotAmat, lattice.rotbase_coordinates, lattice.base_species, n_layers, supercell, filename)
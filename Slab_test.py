@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import Errors
+import Lattice
+import Slab
+
+def silicon(miller_indexes):
+    return Lattice.Lattice(227, 5.43, 'Si', [0, 0, 0], miller_indexes, 'p-1X1-R0')
+
+@pytest.mark.parametrize('supercell', [[[1, 0], [0, 1]], [[2, 0], [0, 1]], [[2, 1], [-1, 1]], [[3, 1], [1, 2]]])
+def test_slab_atoms(supercell):
+    lattice = silicon([1, 1, 1])
+    slab = Slab.lattice_slab(lattice, 3, supercell)
+    assert slab.n_atoms == len(slab.coordinates) == len(slab.species) == 3 * abs(round(np.linalg.det(supercell))) * len(lattice.base_coordinates)
+    distances = np.linalg.norm(slab.coordinates[:, np.newaxis, :] - slab.coordinates[np.newaxis, :, :], axis = -1)
+    assert np.min(distances + 10 * np.eye(slab.n_atoms)) > 1.
+    # No two atoms are periodic images of each other in the slab cell either (minimum image distances).
+    fractional = np.dot(slab.coordinates, np.linalg.inv(slab.Amat))
+    differences = fractional[:, np.newaxis, :] - fractional[np.newaxis, :, :]
+    images = np.linalg.norm(np.dot(differences - np.round(differences), slab.Amat), axis = -1)
+    assert np.min(images + 10 * np.eye(slab.n_atoms)) > 1.
+
+def test_singular_supercell():
+    with pytest.raises(Errors.WrongSupercellMatrix):
+        Slab.supercell_translations([[2, 1], [4, 2]])
+
+def test_memory_mapped_slab(tmp_path, monkeypatch):
+    monkeypatch.setattr(Slab, 'translations_chunk_size', 5)
+    lattice = silicon([0, 0, 1])
+    in_memory = Slab.lattice_slab(lattice, 4, [[2, 1], [-1, 1]])
+    filename = str(tmp_path / 'slab.npy')
+    mapped = Slab.lattice_slab(lattice, 4, [[2, 1], [-1, 1]], filename)
+    assert isinstance(mapped.coordinates, np.memmap)
+    assert np.array_equal(mapped.coordinates, in_memory.coordinates) and np.array_equal(np.load(filename), in_memory.coordinates)
+    assert np.array_equal(mapped.species, in_memory.species)
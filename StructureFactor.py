@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+import Errors
+import Pattern
+
+# Doyle & Turner (Acta Cryst. A24, 390, 1968) electron scattering factor parameters: f(s) = sum_i a_i * exp(-b_i * s^2), with s = sin(theta)/lambda in
+# Angstrom^-1 and f in Angstrom.
+form_factors_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'electron_form_factors.json')
+# Total size of the cached form factor arrays: the least recently used ones are dropped beyond it, and a single larger array is not cached.
+form_factors_cache_bytes = 2 ** 27
+chunk_size = 2 ** 14
+
+_form_factors_parameters = {}
+_form_factors_cache = OrderedDict()
+_form_factors_cache_nbytes = 0
+
+def form_factor_parameters(symbol):
+    """
+    Returns the (4,2) array of (a_i, b_i) Doyle-Turner parameters for the given element symbol. The parameters table is read from disk only once.
+    """
+    if not _form_factors_parameters:
+        with open(form_factors_file) as parameters_file:
+            for key, value in json.load(parameters_file).items():
+                _form_factors_parameters[key] = np.array(value, dtype = float)
+    try:
+        return _form_factors_parameters[str(symbol)]
+    except KeyError:
+        raise Errors.MissingFormFactor(symbol)
+
+def electron_form_factor(symbol, gnorm):
+    """
+    Electron atomic form factor (in Angstrom) of the given element evaluated on an array of |G| values (in Angstrom^-1, 2*pi convention).
+    Results are cached per element and per |G| grid (keyed by a 128 bit BLAKE2 digest of the grid), so that repeated calls on the same reflections
+    never evaluate the Gaussians twice.
+    """
+    global _form_factors_cache_nbytes
+    gnorm = np.ascontiguousarray(gnorm, dtype = float)
+    key = (str(symbol), gnorm.shape, hashlib.blake2b(gnorm, digest_size = 16).digest())
+    if key in _form_factors_cache:
+        _form_factors_cache.move_to_end(key)
+        return _form_factors_cache[key]
+    parameters = form_factor_parameters(symbol)
+    s2 = (gnorm / (4 * np.pi)) ** 2
+    values = np.dot(np.exp(- np.multiply.outer(s2, parameters[:, 1])), parameters[:, 0])
+    values.setflags(write = False)
+    if values.nbytes <= form_factors_cache_bytes:
+        _form_factors_cache[key] = values
+        _form_factors_cache_nbytes += values.nbytes
+        while _form_factors_cache_nbytes > form_factors_cache_bytes:
+            _form_factors_cache_nbytes -= _form_factors_cache.popitem(last = False)[1].nbytes
+    return values
+
+def clear_form_factors_cache():
+    global _form_factors_cache_nbytes
+    _form_factors_cache.clear()
+    _form_factors_cache_nbytes = 0
+
+class StructureFactor():
+    def __init__(self, coordinates, species, symbols, occupancies = None):
+        """
+        coordinates is the (M,3) array of cartesian atomic positions (in Angstrom), species the (M,) array of integer codes indexing symbols, the list
+        of element symbols of the base. occupancies optionally weights every atom.
+        """
+        self.coordinates = np.asarray(coordinates, dtype = float).reshape(-1, 3)
+        self.species = np.asarray(species, dtype = int).reshape(-1)
+        self.symbols = [str(symbol) for symbol in symbols]
+        if occupancies is None:
+            occupancies = np.ones(len(self.species))
+        # (M, S) matrix that sums the phase factors of the atoms of every species, weighted by their occupancies.
+        self.species_matrix = np.zeros((len(self.species), len(self.symbols)))
+        self.species_matrix[np.arange(len(self.species)), self.species] = occupancies
+
+    def _get_form_factors_(self, gnorm):
+        unique_gnorm, inverse = np.unique(np.round(gnorm, 12), return_inverse = True)
+        return np.stack([electron_form_factor(symbol, unique_gnorm)[inverse] for symbol in self.symbols], axis = -1)
+
+    def compute(self, G):
+        """
+        Structure factors F(G) = sum_j f_j(|G|) * exp(i G.r_j) for the (N,3) array of reciprocal vectors G. Reflections are processed in chunks, each one
+        as a single (N,M) phase matrix product over the whole base.
+        """
+        G = np.asarray(G, dtype = float).reshape(-1, 3)
+        form_factors = self._get_form_factors_(np.linalg.norm(G, axis = 1))
+        F = np.empty(len(G), dtype = complex)
+        for start in range(0, len(G), chunk_size):
+            stop = start + chunk_size
+            phases = np.dot(G[start:stop], self.coordinates.T)
+            species_sums = np.dot(np.cos(phases), self.species_matrix) + 1j * np.dot(np.sin(phases), self.species_matrix)
+            F[start:stop] = np.einsum('ns,ns->n', species_sums, form_factors[start:stop])
+        return F
+
+    def intensities(self, G):
+        F = self.compute(G)
+        return F.real ** 2 + F.imag ** 2
+
+    def symmetric_intensities(self, orbits):
+        """
+        Intensities at the reflections of a Symmetry.ReflectionOrbits, computed on its irreducible reflections only and expanded to all of them.
+        """
+        return orbits.compute(self.intensities)
+
+def debye_b_factor(mass, debye_temperature, temperature):
+    """
+    Isotropic Debye-Waller B factor (in Angstrom^2) of an atom of the given mass (in atomic mass units) in a Debye solid, at the given temperatures
+    (in K, array): B = 6 h^2 T / (m k_B Theta^2) * (phi(x) + x / 4), with x = Theta / T and phi(x) = 1/x int_0^x t / (e^t - 1) dt. B depends
+    strongly on Theta, which must be the one fitted to the atomic displacements: for Si, Theta = 543 K gives 0.45 Angstrom^2 at 300 K, while the
+    calorimetric Theta = 645 K gives 0.33 Angstrom^2.
+    """
+    temperature = np.asarray(temperature, dtype = float)
+    x = debye_temperature / temperature
+    u = np.linspace(0., 1., 257)
+    t = np.multiply.outer(x, u)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        integrand = np.where(t > 10 ** (-8), t / np.expm1(t), 1.)
+    phi = (np.sum(integrand, axis = -1) - 0.5 * (integrand[..., 0] + integrand[..., -1])) / (len(u) - 1)
+    boltzmann_constant, atomic_mass = 1.380649e-23, 1.66053906660e-27
+    return 6 * Pattern.planck_constant ** 2 * temperature / (mass * atomic_mass * boltzmann_constant * debye_temperature ** 2) * (phi + x / 4.) * 10 ** 20
+
+class RodSweep():
+    def __init__(self, coordinates, species, symbols, surfBmat, incidence, azimuth = 0., order = 10, occupancies = None, level_tolerance = 10 ** (-6)):
+        """
+        Kinematic intensities along the (h,k) rods of the surface mesh surfBmat (rod_indexes(order)) for sweeps of the beam energy or of the sample
+        temperature, at fixed incidence and azimuth (in degrees). The geometry that does not depend on the swept quantity is computed once here: the
+        rods and, for the atoms grouped by species and by height level, the sums of their in plane phase factors exp(i G_par . r_par). Every energy then
+        only needs the level phases exp(i qz z), the form factors at the new |G| and a small contraction, every temperature one Debye-Waller product.
+        """
+        self.structure = StructureFactor(coordinates, species, symbols, occupancies)
+        self.surfBmat = np.asarray(surfBmat, dtype = float)
+        self.incidence = incidence
+        self.azimuth = azimuth
+        self.hk = Pattern.rod_indexes(order)
+        self.rods = np.dot(self.hk, self.surfBmat)
+        coordinates = self.structure.coordinates
+        keys, level_indexes = np.unique(np.round(coordinates[:, 2] / level_tolerance), return_inverse = True)
+        self.levels = np.array([coordinates[level_indexes.reshape(-1) == level, 2].mean() for level in range(len(keys))])
+        n_species, n_levels = len(self.structure.symbols), len(self.levels)
+        # (M, S * L) matrix summing the occupancy weighted phase factors of the atoms of every species and level.
+        level_matrix = np.zeros((len(coordinates), n_species * n_levels))
+        level_matrix[np.arange(len(coordinates)), self.structure.species * n_levels + level_indexes.reshape(-1)] = self.structure.species_matrix.sum(axis = 1)
+        phases = np.dot(self.rods, coordinates[:, :2].T)
+        self.inplane_sums = (np.dot(np.cos(phases), level_matrix) + 1j * np.dot(np.sin(phases), level_matrix)).reshape(len(self.rods), n_species, n_levels)
+
+    def geometry(self, energies):
+        """
+        Perpendicular momentum transfers qz and visibility masks of the rods, (E, N) arrays for the E beam energies (in eV).
+        """
+        kin = Pattern.incident_wavevector(Pattern.electron_wavevector(np.atleast_1d(energies)), self.incidence, self.azimuth)
+        kout, qz, visible = Pattern.ewald_rod_intersections(self.rods, kin)
+        return qz, visible
+
+    def species_amplitudes(self, qz):
+        """
+        (E, N, S) scattering amplitudes of the atoms of every species, without Debye-Waller factors, and the (E, N) squared |G|, at the given qz.
+        """
+        gnorm2 = np.sum(self.rods ** 2, axis = 1) + qz ** 2
+        form_factors = self.structure._get_form_factors_(np.sqrt(gnorm2).ravel()).reshape(qz.shape + (-1,))
+        level_phases = np.exp(1j * np.multiply.outer(qz, self.levels))
+        return np.einsum('nsl,enl->ens', self.inplane_sums, level_phases) * form_factors, gnorm2
+
+    def energy_sweep(self, energies, B = None):
+        """
+        (E, N) intensities and qz of the rods for the E beam energies, zero for the rods that do not cut the Ewald sphere. B optionally gives the
+        Debye-Waller B factor (in Angstrom^2) of every species.
+        """
+        qz, visible = self.geometry(energies)
+        intensities = np.zeros(qz.shape)
+        step = max(chunk_size // len(self.rods), 1)
+        for start in range(0, len(qz), step):
+            amplitudes, gnorm2 = self.species_amplitudes(qz[start:start + step])
+            if B is not None:
+                amplitudes = amplitudes * np.exp(- np.multiply.outer(gnorm2, np.asarray(B, dtype = float)) / (16 * np.pi ** 2))
+            F = amplitudes.sum(axis = -1)
+            intensities[start:start + step] = F.real ** 2 + F.imag ** 2
+        return np.where(visible, intensities, 0.), qz
+
+    def temperature_sweep(self, energy, B):
+        """
+        (T, N) intensities of the rods at the given beam energy for T sets of per species B factors ((T, S) array, in Angstrom^2, e.g. from
+        debye_b_factor): the amplitudes are computed once and every temperature only applies its Debye-Waller factors.
+        """
+        qz, visible = self.geometry(energy)
+        amplitudes, gnorm2 = self.species_amplitudes(qz)
+        amplitudes, gnorm2, visible = amplitudes[0], gnorm2[0], visible[0]
+        B = np.atleast_2d(np.asarray(B, dtype = float))
+        intensities = np.zeros((len(B), len(self.rods)))
+        step = max(chunk_size // len(self.rods), 1)
+        for start in range(0, len(B), step):
+            F = np.einsum('ns,tns->tn', amplitudes, np.exp(- np.multiply.outer(B[start:start + step], gnorm2).transpose(0, 2, 1) / (16 * np.pi ** 2)))
+            intensities[start:start + step] = F.real ** 2 + F.imag ** 2
+        return np.where(visible, intensities, 0.)
+
+def lattice_rod_sweep(lattice, incidence, azimuth = 0., order = 10):
+    """
+    RodSweep of the hkl oriented, reconstructed Lattice (surfBmat and rotbase_coordinates).
+    """
+    return RodSweep(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table, lattice.surfBmat, incidence, azimuth, order)
+
+def base_arrays(base):
+    """
+    Converts a Lattice base dictionary ({index: {'Element': ..., 'Coordinates': ...}}) into the (coordinates, species, symbols) arrays used by
+    StructureFactor.
+    """
+    symbols = []
+    species = np.empty(len(base), dtype = np.int16)
+    coordinates = np.empty((len(base), 3))
+    for i, key in enumerate(base):
+        symbol = str(base[key]['Element'])
+        if symbol not in symbols:
+            symbols.append(symbol)
+        species[i] = symbols.index(symbol)
+        coordinates[i] = base[key]['Coordinates']
+    return coordinates, species, symbols
+
+def lattice_reflection_orbits(lattice, G, oriented = True):
+    """
+    Symmetry.ReflectionOrbits of the reflections G for a Lattice. The operations are those of the in plane point group of the surface (leaving the
+    normal unchanged) that are also symmetries of the base on the rods of the in plane mesh, the absences those of its space group. With oriented = True
+    G is in the frame of the hkl oriented lattice (rotation_matrix, rotbase_coordinates), otherwise in the frame of Amat and base_coordinates.
+    """
+    import Symmetry
+    import Reconstruction
+    if oriented and hasattr(lattice, 'rotation_matrix'):
+        rotation_matrix, cell, coordinates = lattice.rotation_matrix, lattice.rotAmat, lattice.rotbase_coordinates
+    else:
+        rotation_matrix, cell, coordinates = np.eye(3), lattice.Amat, lattice.base_coordinates
+    planar = Reconstruction.surface_point_group(Symmetry.cartesian_point_group(lattice.space_group_number, lattice.Amat), rotation_matrix)
+    operations = np.tile(np.eye(3), (len(planar), 1, 1))
+    operations[:, :2, :2] = planar
+    operations = Symmetry.base_point_group(operations, coordinates, lattice.base_species, cell[:2, :2])
+    return Symmetry.ReflectionOrbits(G, operations, lattice.space_group_number, np.dot(lattice.Amat, np.transpose(rotation_matrix)))
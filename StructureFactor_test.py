@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import Pattern
+import StructureFactor
+
+def rod_reflections(lattice, order = 6):
+    surfBmat = 2 * np.pi * np.transpose(np.linalg.inv(lattice.rotAmat[:2, :2]))
+    rods = np.dot(Pattern.rod_indexes(order), surfBmat)
+    qz = np.linspace(0.1, 8., 32)
+    return np.concatenate((np.repeat(rods, len(qz), axis = 0), np.tile(qz, len(rods))[:, np.newaxis]), axis = 1)
+
+@pytest.mark.parametrize('miller_indexes', [[1, 1, 1], [0, 0, 1]])
+def test_symmetric_intensities(miller_indexes, gallium_arsenide):
+    lattice = gallium_arsenide(miller_indexes)
+    structure_factor = StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table)
+    for G in (rod_reflections(lattice), np.dot(np.mgrid[-3:4, -3:4, -3:4].reshape(3, -1).T, lattice.rotBmat)):
+        orbits = StructureFactor.lattice_reflection_orbits(lattice, G)
+        assert orbits.reduction() > 1.
+        assert np.allclose(structure_factor.symmetric_intensities(orbits), structure_factor.intensities(G), rtol = 10 ** (-9), atol = 10 ** (-9))
+
+def test_debye_b_factor():
+    # Si at 295 K: measured B = 0.4632 Angstrom^2 (Sears and Shelley, Acta Cryst. A47, 441 (1991)), with the Debye temperature Theta = 543 K.
+    assert abs(StructureFactor.debye_b_factor(28.0855, 543., 295.) / 0.4632 - 1.) < 0.05
+    assert np.isclose(StructureFactor.debye_b_factor(28.0855, 645., 300.), 0.331, atol = 0.001)
+    # High temperature limit 6 h^2 T / (m k_B Theta^2) (plus the zero point term) and zero point limit 3 h^2 / (2 m k_B Theta).
+    h2_mk = Pattern.planck_constant ** 2 / (28.0855 * 1.66053906660e-27 * 1.380649e-23) * 10 ** 20
+    assert np.isclose(StructureFactor.debye_b_factor(28.0855, 543., 10 ** 5), 6 * h2_mk * 10 ** 5 / 543. ** 2, rtol = 10 ** (-3))
+    assert np.isclose(StructureFactor.debye_b_factor(28.0855, 543., 1.), 1.5 * h2_mk / 543., rtol = 10 ** (-3))
+
+def direct_intensities(lattice, G, B):
+    # Explicit sum over the atoms of f_j(|G|) exp(i G.r_j) exp(- B_j |G|^2 / 16 pi^2).
+    gnorm = np.linalg.norm(G, axis = 1)
+    F = np.zeros(len(G), dtype = complex)
+    for position, species in zip(lattice.rotbase_coordinates, lattice.base_species):
+        f = StructureFactor.electron_form_factor(lattice.species_table[species], gnorm)
+        F += f * np.exp(1j * np.dot(G, position)) * np.exp(- B[species] * gnorm ** 2 / (16 * np.pi ** 2))
+    return np.abs(F) ** 2
+
+def test_energy_sweep(gallium_arsenide):
+    lattice = gallium_arsenide([1, 1, 1], 'p-2X1-R0')
+    energies, B = np.array([8000., 12000., 15000., 20000.]), [0.6, 0.5]
+    sweep = StructureFactor.lattice_rod_sweep(lattice, 2., 5., 6)
+    structure_factor = StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table)
+    intensities, qz = sweep.energy_sweep(energies)
+    damped = sweep.energy_sweep(energies, B)[0]
+    for energy, values, damped_values, rods_qz in zip(energies, intensities, damped, qz):
+        pattern = Pattern.KinematicPattern(lattice.surfBmat, energy, 2., 5., 6)
+        G = np.column_stack((pattern.rods, pattern.qz))
+        assert np.array_equal(pattern.hk, sweep.hk) and np.allclose(rods_qz[pattern.visible], pattern.qz[pattern.visible])
+        assert np.allclose(values, np.where(pattern.visible, structure_factor.intensities(G), 0.), rtol = 10 ** (-10), atol = 10 ** (-10))
+        assert np.allclose(damped_values, np.where(pattern.visible, direct_intensities(lattice, G, B), 0.), rtol = 10 ** (-10), atol = 10 ** (-10))
+        assert np.sum(pattern.visible) > 10
+
+def test_temperature_sweep(gallium_arsenide):
+    lattice = gallium_arsenide([0, 0, 1], 'p-2X1-R0')
+    temperatures = np.array([100., 300., 600., 900.])
+    B = np.column_stack((StructureFactor.debye_b_factor(69.723, 360., temperatures), StructureFactor.debye_b_factor(74.922, 360., temperatures)))
+    sweep = StructureFactor.lattice_rod_sweep(lattice, 2.5, 3., 6)
+    intensities = sweep.temperature_sweep(15000., B)
+    pattern = Pattern.KinematicPattern(lattice.surfBmat, 15000., 2.5, 3., 6)
+    G = np.column_stack((pattern.rods, pattern.qz))
+    for values, species_B in zip(intensities, B):
+        assert np.allclose(values, np.where(pattern.visible, direct_intensities(lattice, G, species_B), 0.), rtol = 10 ** (-10), atol = 10 ** (-10))
+    visible = pattern.visible & (np.linalg.norm(G, axis = 1) > 1.)
+    assert np.all(np.diff(intensities[:, visible], axis = 0) <= 0.)
+
+def test_form_factors_cache_bytes(monkeypatch):
+    monkeypatch.setattr(StructureFactor, 'form_factors_cache_bytes', 3 * 8 * 1000)
+    StructureFactor.clear_form_factors_cache()
+    grids = [np.linspace(0., 5., 1000) + shift for shift in (0., 0.1, 0.2, 0.3)]
+    values = [StructureFactor.electron_form_factor('Si', grid) for grid in grids]
+    parameters = StructureFactor.form_factor_parameters('Si')
+    for grid, value in zip(grids, values):
+        assert np.allclose(value, np.dot(np.exp(- np.multiply.outer((grid / (4 * np.pi)) ** 2, parameters[:, 1])), parameters[:, 0]))
+    # Only the three most recent grids fit in the budget, and a grid larger than the whole budget is never cached.
+    assert len(StructureFactor._form_factors_cache) == 3 and StructureFactor._form_factors_cache_nbytes == 3 * 8 * 1000
+    assert StructureFactor.electron_form_factor('Si', grids[3]) is values[3] and StructureFactor.electron_form_factor('Si', grids[0]) is not values[0]
+    StructureFactor.electron_form_factor('Si', np.linspace(0., 5., 4000))
+    assert len(StructureFactor._form_factors_cache) == 3 and StructureFactor._form_factors_cache_nbytes <= StructureFactor.form_factors_cache_bytes
+    StructureFactor.clear_form_factors_cache()
+    assert StructureFactor._form_factors_cache_nbytes == 0
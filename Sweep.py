@@ -0,0 +1,185 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import numpy as np
+import Errors
+import Lattice
+
+job_keys = ('space_group', 'lattice_parameters', 'elements', 'coordinates', 'miller_indexes', 'reconstruction')
+pending, done, failed = 0, 1, -1
+# Arrays with one row of max_atoms entries per job, and the value padding their unused entries.
+padded = {'base_coordinates': np.nan, 'rotbase_coordinates': np.nan, 'base_species': -1}
+
+def grid_jobs(**options):
+    """
+    Returns the list of jobs given by the cartesian product of the options. Every keyword is one of job_keys and its value is the list of the values to
+    sweep, e.g. grid_jobs(space_group = [227], lattice_parameters = [5.40, 5.43], elements = ['Si'], ...).
+    """
+    keys = [key for key in job_keys if key in options]
+    return [dict(zip(keys, values)) for values in itertools.product(*[options[key] for key in keys])]
+
+def load_jobs(filename):
+    """
+    Reads a JSON jobs file, holding either a list of jobs or an object {"grid": {key: [values]}} expanded by grid_jobs.
+    """
+    with open(filename) as jobs_file:
+        jobs = json.load(jobs_file)
+    if isinstance(jobs, dict):
+        jobs = grid_jobs(**jobs['grid'])
+    return jobs
+
+class Sweep():
+    def __init__(self, jobs, directory, max_atoms = 256):
+        """
+        Parameter sweep over a list of Lattice jobs (dicts with job_keys). Results are written by the workers straight into memory-mapped .npy arrays
+        in directory, one row per job: Amat, Bmat, the hkl oriented matrices (rotation_matrix, rotAmat, rotBmat), the surface ones (Woodsmatrix,
+        surfAmat, surfBmat), the number of atoms, the padded base coordinates (bulk and oriented) and species and the job status, which is also the
+        checkpoint used to resume an interrupted sweep. Failures are recorded in failures.json and max_atoms in sweep.json: a sweep resumed with a
+        different max_atoms has its padded arrays reallocated, which fails if a job already stored has more atoms than the new maximum.
+        """
+        self.jobs = [dict(job) for job in jobs]
+        self.directory = directory
+        self.max_atoms = max_atoms
+        self.shapes = {'Amat': ((3, 3), np.float64), 'Bmat': ((3, 3), np.float64), 'rotation_matrix': ((3, 3), np.float64), 'rotAmat': ((3, 3), np.float64), 'rotBmat': ((3, 3), np.float64), 'Woodsmatrix': ((2, 2), np.float64), 'surfAmat': ((2, 2), np.float64), 'surfBmat': ((2, 2), np.float64), 'n_atoms': ((), np.int32), 'base_coordinates': ((max_atoms, 3), np.float64), 'rotbase_coordinates': ((max_atoms, 3), np.float64), 'base_species': ((max_atoms,), np.int16), 'status': ((), np.int8)}
+        self._open_results_()
+
+    def _open_results_(self):
+        os.makedirs(self.directory, exist_ok = True)
+        jobs_filename = os.path.join(self.directory, 'jobs.json')
+        metadata_filename = os.path.join(self.directory, 'sweep.json')
+        resume = os.path.exists(jobs_filename)
+        if resume:
+            with open(jobs_filename) as jobs_file:
+                if json.load(jobs_file) != self.jobs or not os.path.exists(metadata_filename):
+                    raise Errors.WrongSweepCheckpoint(self.directory)
+            with open(metadata_filename) as metadata_file:
+                stored_max_atoms = json.load(metadata_file)['max_atoms']
+        else:
+            with open(jobs_filename, 'w') as jobs_file:
+                json.dump(self.jobs, jobs_file)
+        self.results = {}
+        for name, (shape, dtype) in self.shapes.items():
+            filename = os.path.join(self.directory, name + '.npy')
+            if resume:
+                self.results[name] = np.load(filename, mmap_mode = 'r+')
+            else:
+                self.results[name] = np.lib.format.open_memmap(filename, mode = 'w+', dtype = dtype, shape = (len(self.jobs),) + shape)
+        if resume and stored_max_atoms != self.max_atoms:
+            self._reallocate_(stored_max_atoms)
+        with open(metadata_filename, 'w') as metadata_file:
+            json.dump({'max_atoms': self.max_atoms}, metadata_file)
+        self.failures_filename = os.path.join(self.directory, 'failures.json')
+        self.failures = {}
+        if resume and os.path.exists(self.failures_filename):
+            with open(self.failures_filename) as failures_file:
+                self.failures = {int(index): failure for index, failure in json.load(failures_file).items()}
+
+    def _reallocate_(self, stored_max_atoms):
+        """
+        Copies the padded arrays of a resumed sweep, stored for stored_max_atoms atoms per job, into arrays for max_atoms atoms per job.
+        """
+        done_atoms = self.results['n_atoms'][self.results['status'] == done]
+        if len(done_atoms) and int(np.max(done_atoms)) > self.max_atoms:
+            raise Errors.WrongSweepMaxAtoms(self.directory, self.max_atoms, int(np.max(done_atoms)))
+        kept = min(stored_max_atoms, self.max_atoms)
+        for name, fill in padded.items():
+            shape, dtype = self.shapes[name]
+            filename = os.path.join(self.directory, name + '.npy')
+            stored = self.results.pop(name)
+            array = np.lib.format.open_memmap(filename + '.tmp', mode = 'w+', dtype = dtype, shape = (len(self.jobs),) + shape)
+            array[...] = fill
+            array[:, :kept] = stored[:, :kept]
+            array.flush()
+            del stored, array
+            os.replace(filename + '.tmp', filename)
+            self.results[name] = np.load(filename, mmap_mode = 'r+')
+
+    def remaining(self, retry_failed = False):
+        status = np.asarray(self.results['status'])
+        if retry_failed:
+            return [int(index) for index in np.nonzero(status != done)[0]]
+        return [int(index) for index in np.nonzero(status == pending)[0]]
+
+    def run(self, workers = None, retry_failed = False, progress = None):
+        """
+        Runs all the jobs that are not done yet on a pool of worker processes. progress, if given, is called as progress(completed, total) after every job.
+        Returns the dictionary of the failures, indexed by job.
+        """
+        indexes = self.remaining(retry_failed)
+        total = len(self.jobs)
+        completed = total - len(indexes)
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = _initialize_worker_, initargs = (self.directory, tuple(self.shapes))) as executor:
+            futures = {executor.submit(_run_job_, index, self.jobs[index], self.max_atoms): index for index in indexes}
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                try:
+                    failure = future.result()
+                except Exception as error:
+                    failure = {'code': None, 'name': type(error).__name__, 'message': str(error)}
+                if failure is None:
+                    if self.failures.pop(index, None) is not None:
+                        self._write_failures_()
+                else:
+                    self.results['status'][index] = failed
+                    self.failures[index] = failure
+                    self._write_failures_()
+                completed += 1
+                if progress is not None:
+                    progress(completed, total)
+        self.results['status'].flush()
+        return self.failures
+
+    def _write_failures_(self):
+        with open(self.failures_filename, 'w') as failures_file:
+            json.dump({str(index): failure for index, failure in sorted(self.failures.items())}, failures_file, indent = 1)
+
+_worker_results = {}
+
+def _initialize_worker_(directory, names):
+    Errors.exit_on_error = False
+    for name in names:
+        _worker_results[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode = 'r+')
+
+def _run_job_(index, job, max_atoms):
+    try:
+        lattice = Lattice.Lattice(*[job.get(key) for key in job_keys])
+        n_atoms = len(lattice.base_species)
+        if n_atoms > max_atoms:
+            raise Errors.TooManyAtoms(n_atoms, max_atoms)
+        for name in ('Amat', 'Bmat', 'rotation_matrix', 'rotAmat', 'rotBmat', 'Woodsmatrix', 'surfAmat', 'surfBmat'):
+            _worker_results[name][index] = getattr(lattice, name)
+        _worker_results['n_atoms'][index] = n_atoms
+        for name, fill in padded.items():
+            _worker_results[name][index] = fill
+            _worker_results[name][index, :n_atoms] = getattr(lattice, name)
+        _worker_results['status'][index] = done
+        return None
+    except Errors.Errors as error:
+        return {'code': getattr(error, 'code', None), 'name': getattr(error, 'name', type(error).__name__), 'message': getattr(error, 'message', str(error))}
+    except (Exception, SystemExit) as error:
+        return {'code': None, 'name': type(error).__name__, 'message': str(error)}
+
+def _print_progress_(completed, total):
+    sys.stderr.write('\r{0}/{1} jobs completed'.format(completed, total))
+    if completed == total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Runs a parameter sweep of Lattice constructions on a process pool.')
+    parser.add_argument('jobs', help = 'JSON file with a list of jobs or a {"grid": {...}} object')
+    parser.add_argument('directory', help = 'output directory for the memory-mapped results and the checkpoint')
+    parser.add_argument('--workers', type = int, default = None, help = 'number of worker processes (default: number of CPUs)')
+    parser.add_argument('--max-atoms', type = int, default = 256, help = 'maximum number of base atoms stored per job')
+    parser.add_argument('--retry-failed', action = 'store_true', help = 'run again the jobs that failed in a previous run')
+    arguments = parser.parse_args(arguments)
+    sweep = Sweep(load_jobs(arguments.jobs), arguments.directory, arguments.max_atoms)
+    failures = sweep.run(arguments.workers, arguments.retry_failed, _print_progress_)
+    print('{0} jobs done, {1} failed (see {2})'.format(int(np.sum(sweep.results['status'] == done)), len(failures), sweep.failures_filename))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
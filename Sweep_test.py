@@ -0,0 +1,40 @@
+import json
+import os
+import numpy as np
+import pytest
+import Errors
+import Sweep
+
+def silicon_jobs():
+    return Sweep.grid_jobs(space_group = [227], lattice_parameters = [5.43], elements = ['Si'], coordinates = [[0, 0, 0]], miller_indexes = [[0, 0, 1], [1, 1, 1]], reconstruction = ['p-1X1-R0', 'p-2X1-R0'])
+
+def read_failures(sweep):
+    with open(sweep.failures_filename) as failures_file:
+        return json.load(failures_file)
+
+def test_resume_with_more_atoms(tmp_path):
+    directory = str(tmp_path / 'sweep')
+    sweep = Sweep.Sweep(silicon_jobs(), directory, max_atoms = 4)
+    failures = sweep.run(workers = 2)
+    assert sorted(failures) == [0, 1, 2, 3] and all(failure['code'] == 'SWEEPERROR2' for failure in failures.values())
+    assert len(read_failures(sweep)) == 4
+    sweep = Sweep.Sweep(silicon_jobs(), directory, max_atoms = 8)
+    assert sweep.results['base_coordinates'].shape == (4, 8, 3) and sweep.remaining() == []
+    assert sweep.run(workers = 2, retry_failed = True) == {} and read_failures(sweep) == {}
+    results = Sweep.Sweep(silicon_jobs(), directory, max_atoms = 8).results
+    assert np.all(results['status'] == Sweep.done) and np.all(results['n_atoms'] == 8)
+    assert not np.allclose(results['rotAmat'][0], results['rotAmat'][2])
+    assert not np.allclose(results['Woodsmatrix'][0], results['Woodsmatrix'][1])
+    assert np.allclose(results['surfAmat'][1], np.matmul(results['Woodsmatrix'][1], results['rotAmat'][1, :2, :2]))
+    assert not np.any(np.isnan(results['rotbase_coordinates']))
+    with pytest.raises(Errors.WrongSweepMaxAtoms):
+        Sweep.Sweep(silicon_jobs(), directory, max_atoms = 4)
+
+def test_resume_with_other_jobs(tmp_path):
+    directory = str(tmp_path / 'sweep')
+    Sweep.Sweep(silicon_jobs(), directory)
+    with pytest.raises(Errors.WrongSweepCheckpoint):
+        Sweep.Sweep(silicon_jobs()[:2], directory)
+    os.remove(os.path.join(directory, 'sweep.json'))
+    with pytest.raises(Errors.WrongSweepCheckpoint):
+        Sweep.Sweep(silicon_jobs(), directory)
@@ -0,0 +1,233 @@
+from collections import OrderedDict
+import functools
+import os
+import numpy as np
+
+# Precompiled table of the symmetry operations of the 230 space groups (in the default settings used by pymatgen), so that structures can be expanded with
+# pure NumPy. Rotations are stored as int8 matrices and translations as int8 multiples of 1/24. Rebuild it with build_space_group_table().
+space_groups_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'space_groups.npz')
+translation_denominator = 24
+_space_groups_table = {}
+
+def build_space_group_table(filename = space_groups_file):
+    from pymatgen.symmetry.groups import SpaceGroup
+    rotations, translations, offsets, symbols = [], [], [0], []
+    for number in range(1, 231):
+        space_group = SpaceGroup.from_int_number(number)
+        symbols.append(space_group.symbol)
+        for operation in space_group.symmetry_ops:
+            rotations.append(np.round(operation.rotation_matrix).astype(np.int8))
+            translations.append(np.round(operation.translation_vector * translation_denominator).astype(np.int8))
+        offsets.append(len(rotations))
+    np.savez_compressed(filename, rotations = np.array(rotations), translations = np.array(translations), offsets = np.array(offsets, dtype = np.int32), symbols = np.array(symbols))
+
+def _get_space_groups_table_():
+    if not _space_groups_table:
+        with np.load(space_groups_file) as table:
+            for key in table.files:
+                _space_groups_table[key] = table[key]
+    return _space_groups_table
+
+def space_group_operations(number):
+    """
+    Returns the (K,3,3) rotations and the (K,3) fractional translations of the given space group number.
+    """
+    table = _get_space_groups_table_()
+    start, stop = table['offsets'][number - 1], table['offsets'][number]
+    return table['rotations'][start:stop].astype(float), table['translations'][start:stop] / translation_denominator
+
+@functools.lru_cache(maxsize = None)
+def space_group_number(symbol):
+    """
+    Space group number of the given Hermann-Mauguin symbol. Symbols that are not found in the bundled table (e.g. non default settings) are resolved
+    through pymatgen, which is imported only in that case.
+    """
+    symbols = _get_space_groups_table_()['symbols']
+    matches = np.nonzero(symbols == symbol)[0]
+    if len(matches) > 0:
+        return int(matches[0]) + 1
+    from pymatgen.symmetry.groups import SpaceGroup
+    return SpaceGroup(symbol).int_number
+
+@functools.lru_cache(maxsize = None)
+def _point_group_rotations_(number):
+    # The fractional rotations are integer matrices, repeated once per centering translation: deduplicate them once per space group.
+    rotations = space_group_operations(number)[0]
+    indexes = np.unique(rotations.reshape(len(rotations), 9), axis = 0, return_index = True)[1]
+    point_group = rotations[np.sort(indexes)]
+    point_group.setflags(write = False)
+    return point_group
+
+def cartesian_point_group(number, Amat):
+    """
+    (P,3,3) distinct rotational parts of the space group operations written in cartesian coordinates for the cell Amat (lattice vectors as rows),
+    i.e. the point group of the crystal with the centering and screw/glide translations dropped.
+    """
+    A = np.transpose(Amat)
+    return np.matmul(np.matmul(A, _point_group_rotations_(int(number))), np.linalg.inv(A))
+
+def get_orbit(number, point, tolerance = 10 ** (-5)):
+    """
+    All the fractional positions generated by the space group operations from the given point, in one array operation. Duplicates closer than
+    tolerance are removed keeping the first occurrence, as pymatgen get_orbit does.
+    """
+    rotations, translations = space_group_operations(number)
+    orbit = np.mod(np.round(np.dot(rotations, point) + translations, 10), 1.)
+    close = np.all(np.abs(orbit[:, np.newaxis, :] - orbit[np.newaxis, :, :]) < tolerance, axis = 2)
+    duplicated = np.any(np.tril(close, -1), axis = 1)
+    return orbit[~ duplicated]
+
+def expand_sites(space_group, elements, coordinates):
+    """
+    Pure NumPy equivalent of pymatgen Structure.from_spacegroup: returns the (N,3) fractional coordinates and the N elements of all the sites generated
+    from the given inequivalent sites. Space groups given by a symbol that is not in the bundled table are expanded by pymatgen.
+    """
+    points = np.reshape(coordinates, (-1, 3)).astype(float)
+    if isinstance(space_group, str) and space_group not in _get_space_groups_table_()['symbols']:
+        from pymatgen.symmetry.groups import SpaceGroup
+        space_group_object = SpaceGroup(space_group)
+        orbits = [np.array(space_group_object.get_orbit(point)) for point in points]
+    else:
+        if isinstance(space_group, str):
+            space_group = space_group_number(space_group)
+        orbits = [get_orbit(int(space_group), point) for point in points]
+    sites_elements = tuple(element for element, orbit in zip(elements, orbits) for i in range(len(orbit)))
+    return np.vstack(orbits), sites_elements
+
+class SymmetryCache():
+    def __init__(self, maxsize = 128):
+        """
+        Least recently used cache of the Wyckoff expansions. The expansion only depends on the space group, on the elements and on their fractional
+        coordinates, so every entry stores the expanded fractional sites and the cartesian positions are rebuilt for any new cell.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key_(self, space_group, elements, coordinates):
+        return (space_group, tuple(str(element) for element in elements), tuple(map(tuple, np.round(np.reshape(coordinates, (-1, 3)), 10))))
+
+    def expand(self, space_group, elements, coordinates):
+        """
+        Returns the (N,3) fractional coordinates and the N elements of all the sites generated by the space group from the given inequivalent sites.
+        """
+        key = self._key_(space_group, elements, coordinates)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        fractional_coordinates, sites_elements = expand_sites(space_group, elements, coordinates)
+        fractional_coordinates.setflags(write = False)
+        entry = (fractional_coordinates, sites_elements)
+        if self.maxsize > 0:
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False)
+        return entry
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last = False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'maxsize': self.maxsize, 'currsize': len(self._entries)}
+
+expansion_cache = SymmetryCache()
+
+def base_point_group(operations, coordinates, species, mesh, tolerance = 10 ** (-4)):
+    """
+    Keeps the (P,3,3) cartesian point operations that map the atoms (coordinates, species) onto themselves up to a common translation and to the
+    translations of the in plane mesh (2x2, vectors as rows), i.e. the operations under which the kinematic intensities of the base are invariant on
+    every rod of the mesh. Operations involving a translation along the normal, like the screw axes of the bulk, do not survive on a single terrace.
+    """
+    coordinates = np.asarray(coordinates, dtype = float).reshape(-1, 3)
+    species = np.asarray(species).reshape(-1)
+    inverse_mesh = np.linalg.inv(mesh)
+    same_species = species[:, np.newaxis] == species[np.newaxis, :]
+    kept = []
+    for operation in np.asarray(operations, dtype = float):
+        images = np.dot(coordinates, operation.T)
+        for shift in coordinates[same_species[0]] - images[0]:
+            differences = images[:, np.newaxis, :] + shift - coordinates[np.newaxis, :, :]
+            fractional = np.dot(differences[:, :, :2], inverse_mesh)
+            matches = same_species & (np.abs(differences[:, :, 2]) < tolerance) & np.all(np.abs(fractional - np.round(fractional)) < tolerance, axis = 2)
+            if np.all(np.any(matches, axis = 1)):
+                kept.append(operation)
+                break
+    return np.array(kept).reshape(-1, 3, 3)
+
+def systematic_absences(number, hkl, tolerance = 10 ** (-6), chunk_size = 2 ** 14):
+    """
+    Mask of the (N,3) Miller indexes (in the conventional cell of the space group) that are systematically absent: h is extinct when an operation
+    (R, t) leaves it unchanged (h R = h) while its translation gives a phase (h.t not integer). Non integer indexes are never absent.
+    """
+    rotations, translations = space_group_operations(number)
+    hkl = np.asarray(hkl, dtype = float).reshape(-1, 3)
+    integer = np.nonzero(np.all(np.abs(hkl - np.round(hkl)) < tolerance, axis = 1))[0]
+    absent = np.zeros(len(hkl), dtype = bool)
+    for start in range(0, len(integer), chunk_size):
+        indexes = integer[start:start + chunk_size]
+        h = np.round(hkl[indexes])
+        # h R for all the P operations at once, as a single (N,3) x (3,3P) product
+        images = np.dot(h, np.transpose(rotations, (1, 0, 2)).reshape(3, -1)).reshape(len(h), -1, 3)
+        invariant = np.all(np.abs(images - h[:, np.newaxis, :]) < tolerance, axis = 2)
+        phases = np.dot(h, translations.T)
+        shifted = np.abs(phases - np.round(phases)) > tolerance
+        absent[indexes] = np.any(invariant & shifted, axis = 1)
+    return absent
+
+class ReflectionOrbits():
+    def __init__(self, G, operations, number = None, Amat = None, tolerance = 10 ** (-6)):
+        """
+        Splits the (N,3) reciprocal vectors G into orbits of the cartesian point operations ((P,3,3), or (P,2,2) in plane operations acting on the
+        first two components, as for the rods at fixed qz of a surface), so that intensities are computed on one representative per orbit only and
+        expanded back with the orbit index table. When the space group number and the cell Amat (in the frame of G) are given, the systematically
+        absent reflections are found up front and never computed.
+        """
+        self.G = np.asarray(G, dtype = float).reshape(-1, 3)
+        operations = np.asarray(operations, dtype = float)
+        if operations.shape[-1] == 2:
+            planar = operations.reshape(-1, 2, 2)
+            operations = np.tile(np.eye(3), (len(planar), 1, 1))
+            operations[:, :2, :2] = planar
+        keys = np.round(np.matmul(self.G, np.swapaxes(operations, -1, -2)) / tolerance).astype(np.int64)
+        # Canonical label of every orbit: the lexicographically smallest image of its vectors.
+        canonical = keys[0]
+        for image in keys[1:]:
+            smaller = (image[:, 0] < canonical[:, 0]) | ((image[:, 0] == canonical[:, 0]) & ((image[:, 1] < canonical[:, 1]) | ((image[:, 1] == canonical[:, 1]) & (image[:, 2] < canonical[:, 2]))))
+            canonical = np.where(smaller[:, np.newaxis], image, canonical)
+        labels, representatives, orbit_indexes = np.unique(canonical, axis = 0, return_index = True, return_inverse = True)
+        self.orbit_indexes = orbit_indexes.reshape(-1)
+        self.absent = np.zeros(len(self.G), dtype = bool)
+        if number is not None and Amat is not None:
+            self.absent = systematic_absences(number, np.dot(self.G[representatives], np.transpose(Amat)) / (2 * np.pi))[self.orbit_indexes]
+        self.representatives = representatives[~ self.absent[representatives]]
+        self.irreducible_G = self.G[self.representatives]
+        # Orbit index of every vector in the list of computed representatives (absent orbits point to an extra zero entry).
+        positions = np.full(len(labels), len(self.representatives))
+        positions[~ self.absent[representatives]] = np.arange(len(self.representatives))
+        self.expansion_indexes = positions[self.orbit_indexes]
+
+    def expand(self, values):
+        """
+        Full (N, ...) array from the values computed at irreducible_G, with zeros at the absent reflections.
+        """
+        values = np.asarray(values)
+        return np.concatenate((values, np.zeros((1,) + values.shape[1:], dtype = values.dtype)))[self.expansion_indexes]
+
+    def compute(self, function):
+        return self.expand(function(self.irreducible_G))
+
+    def reduction(self):
+        """
+        Ratio between the number of reflections and the number actually computed.
+        """
+        return len(self.G) / max(len(self.representatives), 1)
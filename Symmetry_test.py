@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import Lattice
+import Symmetry
+
+# Generic position (no special Wyckoff site) and a special one, on the inversion center/origin of most settings.
+points = [[0.1234, 0.3456, 0.7891], [0., 0., 0.]]
+
+def sorted_rows(coordinates):
+    coordinates = np.mod(np.round(np.asarray(coordinates, dtype = float), 8), 1.)
+    return coordinates[np.lexsort(np.transpose(coordinates)[::-1])]
+
+@pytest.mark.parametrize('number', range(1, 231))
+def test_space_group_table_matches_pymatgen(number):
+    groups = pytest.importorskip('pymatgen.symmetry.groups')
+    space_group = groups.SpaceGroup.from_int_number(number)
+    rotations, translations = Symmetry.space_group_operations(number)
+    assert len(rotations) == len(space_group.symmetry_ops)
+    for rotation, translation, operation in zip(rotations, translations, space_group.symmetry_ops):
+        assert np.allclose(rotation, operation.rotation_matrix) and np.allclose(translation, operation.translation_vector)
+    assert Symmetry.space_group_number(space_group.symbol) == number
+    for point in points:
+        orbit = Symmetry.get_orbit(number, point)
+        assert np.allclose(sorted_rows(orbit), sorted_rows(space_group.get_orbit(point)), atol = 10 ** (-6))
+
+def test_strain_sweep_expands_once(monkeypatch):
+    monkeypatch.setattr(Symmetry, 'expansion_cache', Symmetry.SymmetryCache())
+    parameters = np.linspace(5.3, 5.6, 1000)
+    lattices = [Lattice.Lattice(216, float(a), ['Ga', 'As'], [[0, 0, 0], [0.25, 0.25, 0.25]], [0, 0, 1], 'p-1X1-R0') for a in parameters]
+    assert Symmetry.expansion_cache.info() == {'hits': 999, 'misses': 1, 'maxsize': 128, 'currsize': 1}
+    assert np.allclose(lattices[-1].base_coordinates, lattices[0].base_coordinates * parameters[-1] / parameters[0])
+
+def test_cache_eviction():
+    cache = Symmetry.SymmetryCache(maxsize = 2)
+    sites = {name: (227, ('Si',), [[x, 0., 0.]]) for name, x in (('a', 0.), ('b', 0.1), ('c', 0.2))}
+    for name in ('a', 'b', 'a', 'c', 'a', 'b'):
+        cache.expand(*sites[name])
+    # c evicts b, the least recently used entry (a was used again), so b misses again and evicts c.
+    assert cache.info() == {'hits': 2, 'misses': 4, 'maxsize': 2, 'currsize': 2}
+    coordinates, elements = cache.expand(*sites['a'])
+    assert cache.info()['hits'] == 3 and not coordinates.flags.writeable and len(coordinates) == len(elements)
+    cache.resize(1)
+    cache.expand(*sites['a'])
+    assert cache.info() == {'hits': 4, 'misses': 4, 'maxsize': 1, 'currsize': 1}
+    cache.resize(0)
+    cache.expand(*sites['a'])
+    assert cache.info() == {'hits': 4, 'misses': 5, 'maxsize': 0, 'currsize': 0}
+    cache.clear()
+    assert cache.info() == {'hits': 0, 'misses': 0, 'maxsize': 0, 'currsize': 0}
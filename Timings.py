@@ -0,0 +1,142 @@
+import contextlib
+import functools
+import os
+import time
+
+# Instrumentation is opt-in: stages are recorded only while enabled is True (set at import by the LATTICE_TIMINGS environment variable, so that a
+# production run can be instrumented without touching the code) or inside a collect() block. cProfile, json, threading and tracemalloc are imported only
+# when they are used, so that importing Lattice does not pay for them.
+enabled = os.environ.get('LATTICE_TIMINGS', '0') not in ('', '0')
+trace_allocations = False
+_collectors = []
+# Running peaks of the traced memory of the open stages, innermost last: a nested stage resets the tracemalloc peak, so the peak reached so far is
+# folded into the enclosing stage first and the nested peak is folded back into it on exit.
+_peaks = []
+
+class Timings():
+    def __init__(self):
+        """
+        Per stage statistics (number of calls, total wall time in seconds and total allocated bytes, the latter only when allocations are traced) and
+        the list of the single stage events, used for the Chrome trace export.
+        """
+        self.stats = {}
+        self.events = []
+        self.profile = None
+
+    def record(self, stage, start, duration, allocated):
+        import threading
+        stats = self.stats.setdefault(stage, {'calls': 0, 'wall_time': 0., 'allocated': 0})
+        stats['calls'] += 1
+        stats['wall_time'] += duration
+        stats['allocated'] += allocated
+        self.events.append((stage, start, duration, os.getpid(), threading.get_ident()))
+
+    def as_dict(self):
+        return {stage: dict(stats) for stage, stats in self.stats.items()}
+
+    def to_json(self, filename):
+        import json
+        with open(filename, 'w') as output:
+            json.dump(self.as_dict(), output, indent = 1)
+
+    def to_chrome_trace(self, filename):
+        """
+        Writes the recorded events in the Chrome trace event format, viewable in chrome://tracing or Perfetto.
+        """
+        import json
+        events = [{'name': stage, 'cat': 'Lattice', 'ph': 'X', 'ts': start * 10 ** 6, 'dur': duration * 10 ** 6, 'pid': pid, 'tid': tid} for stage, start, duration, pid, tid in self.events]
+        with open(filename, 'w') as output:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+
+    def print_profile(self, sort = 'cumulative', limit = 20):
+        if self.profile is not None:
+            import pstats
+            pstats.Stats(self.profile).sort_stats(sort).print_stats(limit)
+
+    def __repr__(self):
+        lines = ['{0:24s} {1:>8s} {2:>14s} {3:>14s}'.format('stage', 'calls', 'wall time [s]', 'allocated [B]')]
+        for stage, stats in self.stats.items():
+            lines.append('{0:24s} {1:8d} {2:14.6f} {3:14d}'.format(stage, stats['calls'], stats['wall_time'], stats['allocated']))
+        return '\n'.join(lines)
+
+def is_active():
+    return enabled or len(_collectors) > 0
+
+@contextlib.contextmanager
+def stage(timings, name):
+    """
+    Times the enclosed block as the given stage, recording it in timings (the Timings of a Lattice, or None when instrumentation is off) and in every
+    active collector.
+    """
+    if timings is None:
+        yield
+        return
+    allocations = trace_allocations and _is_tracing_()
+    if allocations:
+        import tracemalloc
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        _peaks.append(before)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        allocated = 0
+        if allocations:
+            peak = max(_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+            allocated = peak - before
+        timings.record(name, start, duration, allocated)
+        for collector in _collectors:
+            collector.record(name, start, duration, allocated)
+
+def _is_tracing_():
+    import tracemalloc
+    return tracemalloc.is_tracing()
+
+def timed(name):
+    """
+    Decorator timing a Lattice method as the given stage.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *arguments, **keywords):
+            with stage(getattr(self, 'timings', None), name):
+                return method(self, *arguments, **keywords)
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def collect(profile = False, allocations = False):
+    """
+    Context manager that turns the instrumentation on and aggregates the stages of all the Lattice constructions done inside the block into the
+    Timings object it yields. With profile = True the block also runs under cProfile (see Timings.print_profile), with allocations = True the
+    allocated bytes of every stage are traced with tracemalloc.
+    """
+    global trace_allocations
+    import tracemalloc
+    collector = Timings()
+    _collectors.append(collector)
+    previous_trace_allocations = trace_allocations
+    started_tracing = allocations and not tracemalloc.is_tracing()
+    if allocations:
+        trace_allocations = True
+        if started_tracing:
+            tracemalloc.start()
+    if profile:
+        import cProfile
+        collector.profile = cProfile.Profile()
+        collector.profile.enable()
+    try:
+        yield collector
+    finally:
+        if profile:
+            collector.profile.disable()
+        if started_tracing:
+            tracemalloc.stop()
+        trace_allocations = previous_trace_allocations
+        _collectors.remove(collector)
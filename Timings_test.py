@@ -0,0 +1,38 @@
+import json
+import Timings
+
+size = 8 * 2 ** 20
+
+def test_nested_stage_keeps_outer_peak():
+    timings = Timings.Timings()
+    with Timings.collect(allocations = True) as collector:
+        with Timings.stage(timings, 'outer'):
+            block = bytearray(size)
+            del block
+            with Timings.stage(timings, 'inner'):
+                block = bytearray(size // 8)
+                del block
+    stats = timings.as_dict()
+    assert size <= stats['outer']['allocated'] < 2 * size
+    assert size // 8 <= stats['inner']['allocated'] < size // 2
+    assert collector.as_dict() == stats
+
+def test_nested_stage_peak_reaches_outer():
+    timings = Timings.Timings()
+    with Timings.collect(allocations = True):
+        with Timings.stage(timings, 'outer'):
+            with Timings.stage(timings, 'inner'):
+                block = bytearray(size)
+                del block
+    stats = timings.as_dict()
+    assert size <= stats['outer']['allocated'] < 2 * size and size <= stats['inner']['allocated'] < 2 * size
+    assert Timings._peaks == []
+
+def test_exports(tmp_path):
+    timings = Timings.Timings()
+    with Timings.stage(timings, 'stage'):
+        pass
+    timings.to_json(str(tmp_path / 'timings.json'))
+    timings.to_chrome_trace(str(tmp_path / 'trace.json'))
+    assert json.load(open(str(tmp_path / 'timings.json')))['stage']['calls'] == 1
+    assert json.load(open(str(tmp_path / 'trace.json')))['traceEvents'][0]['name'] == 'stage'
@@ -0,0 +1,184 @@
+import os
+import queue
+import threading
+import numpy as np
+import Pattern
+import StructureFactor
+import Errors
+
+def open_video(filename, shape = None, dtype = np.uint16, offset = 0):
+    """
+    Memory-maps a recorded RHEED video as an (F, rows, columns) array without reading it: .npy files are opened with their own header, raw files
+    need the (rows, columns) frame shape, the pixel dtype and the byte offset of the first frame.
+    """
+    if filename.endswith('.npy'):
+        frames = np.load(filename, mmap_mode = 'r')
+        return frames if frames.ndim == 3 else frames.reshape((-1,) + frames.shape[-2:])
+    data_bytes = os.path.getsize(filename) - offset
+    frame_bytes = 0 if shape is None else int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if frame_bytes == 0 or data_bytes % frame_bytes != 0:
+        raise Errors.WrongVideoShape(filename, shape, np.dtype(dtype).name)
+    return np.memmap(filename, dtype = dtype, mode = 'r', offset = offset, shape = (data_bytes // frame_bytes,) + tuple(shape))
+
+def mean_background(frames, n_frames = 100):
+    """
+    Background frame estimated as the mean of the first n_frames frames (e.g. recorded with the beam blanked).
+    """
+    background = np.zeros(frames.shape[1:])
+    for frame in frames[:n_frames]:
+        background += frame
+    return (background / max(min(n_frames, len(frames)), 1)).astype(np.float32)
+
+def spot_regions(rows, columns, shape, half_width = 3, half_height = 3, streak_length = 0):
+    """
+    Pixels integrated for every one of the S predicted spots: a (2 half_height + 1) x (2 half_width + 1) box around each spot, extended upwards by
+    streak_length pixels along the streak. Returns the flat pixel indexes and the spot label of every pixel, clipped to the frame, ready for bincount.
+    """
+    rows, columns = np.asarray(rows, dtype = int).ravel(), np.asarray(columns, dtype = int).ravel()
+    box_rows, box_columns = np.meshgrid(np.arange(- half_height - int(streak_length), half_height + 1), np.arange(- half_width, half_width + 1), indexing = 'ij')
+    pixel_rows = rows[:, np.newaxis] + box_rows.ravel()
+    pixel_columns = columns[:, np.newaxis] + box_columns.ravel()
+    inside = (pixel_rows >= 0) & (pixel_rows < shape[0]) & (pixel_columns >= 0) & (pixel_columns < shape[1])
+    labels = np.broadcast_to(np.arange(len(rows))[:, np.newaxis], pixel_rows.shape)
+    return (pixel_rows * shape[1] + pixel_columns)[inside], labels[inside]
+
+def goodness_of_fit(measured, simulated):
+    """
+    Fit of the (B, S) measured spot intensities of B frames with the simulated ones (S,) scaled by the least squares factor: returns the (B,) scale
+    factors, R factors (sum of the squared residuals over the sum of the squared intensities) and correlation coefficients.
+    """
+    simulated = np.asarray(simulated, dtype = float)
+    scale = np.dot(measured, simulated) / max(np.dot(simulated, simulated), 10 ** (-300))
+    residuals = measured - scale[:, np.newaxis] * simulated
+    r_factor = np.sum(residuals ** 2, axis = 1) / np.maximum(np.sum(measured ** 2, axis = 1), 10 ** (-300))
+    centered_measured = measured - measured.mean(axis = 1, keepdims = True)
+    centered_simulated = simulated - simulated.mean()
+    correlation = np.dot(centered_measured, centered_simulated) / np.maximum(np.linalg.norm(centered_measured, axis = 1) * np.linalg.norm(centered_simulated), 10 ** (-300))
+    return scale, r_factor, correlation
+
+def predicted_spots(lattice, screen, energy, incidence, azimuth = 0., order = 10):
+    """
+    Screen (row, column) positions and kinematic intensities of the spots of the hkl oriented, reconstructed Lattice (surfBmat and
+    rotbase_coordinates) that hit the screen.
+    """
+    pattern = Pattern.KinematicPattern(lattice.surfBmat, energy, incidence, azimuth, order)
+    polar, azimuthal = pattern._get_exit_angles_()
+    rows, columns, on_screen = screen.project(np.nan_to_num(polar, nan = -90.), np.nan_to_num(azimuthal, nan = 180.))
+    structure_factor = StructureFactor.StructureFactor(lattice.rotbase_coordinates, lattice.base_species, lattice.species_table)
+    G = np.column_stack((pattern.rods, pattern.qz))
+    intensities = structure_factor.intensities(G)
+    return rows[on_screen], columns[on_screen], intensities[on_screen]
+
+class VideoComparison():
+    def __init__(self, frames, rows, columns, simulated, background = None, half_width = 3, half_height = 3, streak_length = 0, batch = 16):
+        """
+        Streaming comparison of the (F, rows, columns) video frames (e.g. from open_video) with the S simulated spots at the given pixel positions and
+        with the given intensities (e.g. from predicted_spots). Every frame is background subtracted, its spot regions (see spot_regions) are integrated
+        and the integrated intensities are scored with goodness_of_fit. Frames are processed batch at a time.
+        """
+        self.frames = frames
+        self.simulated = np.asarray(simulated, dtype = float).ravel()
+        self.n_spots = len(self.simulated)
+        self.background = None if background is None else np.asarray(background, dtype = np.float32).reshape(frames.shape[1:])
+        self.pixels, self.labels = spot_regions(rows, columns, frames.shape[1:], half_width, half_height, streak_length)
+        self.batch = batch
+
+    def _decode_(self, start):
+        stack = np.asarray(self.frames[start:start + self.batch], dtype = np.float32).reshape(-1, self.frames.shape[1] * self.frames.shape[2])
+        if self.background is not None:
+            stack -= self.background.ravel()
+        return stack
+
+    def _extract_(self, stack):
+        # One bincount over the spot pixels of all the frames of the batch: frame b, spot s goes to bin b * S + s.
+        values = stack[:, self.pixels]
+        bins = (np.arange(len(stack))[:, np.newaxis] * self.n_spots + self.labels).ravel()
+        return np.bincount(bins, weights = values.ravel(), minlength = len(stack) * self.n_spots).reshape(len(stack), self.n_spots)
+
+    def run(self, directory = None, workers = 2, queue_size = 4, progress = None):
+        """
+        Runs the decode, extract and score stages on their own threads (workers extraction threads), connected by queues of at most queue_size
+        batches, so that reading, integrating and scoring overlap and the memory in use does not depend on the length of the video. Results go to
+        (F, S) intensities and (F, 3) scores (scale, R factor, correlation) arrays, memory-mapped .npy files when a directory is given. progress, if
+        given, is called as progress(frames done, total frames). Returns (intensities, scores).
+        """
+        n_frames = len(self.frames)
+        if directory is None:
+            intensities, scores = np.zeros((n_frames, self.n_spots), dtype = np.float32), np.zeros((n_frames, 3), dtype = np.float32)
+        else:
+            os.makedirs(directory, exist_ok = True)
+            intensities = np.lib.format.open_memmap(os.path.join(directory, 'intensities.npy'), mode = 'w+', dtype = np.float32, shape = (n_frames, self.n_spots))
+            scores = np.lib.format.open_memmap(os.path.join(directory, 'scores.npy'), mode = 'w+', dtype = np.float32, shape = (n_frames, 3))
+        decoded, extracted = queue.Queue(queue_size), queue.Queue(queue_size)
+        errors = []
+        stop = threading.Event()
+
+        # Queue operations time out regularly to check whether another stage failed, so that no thread is left waiting forever.
+        def put(target, item):
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout = 0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def get(source):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout = 0.1)
+                except queue.Empty:
+                    pass
+
+        def stage(function):
+            def wrapper(*arguments):
+                try:
+                    function(*arguments)
+                except Exception as error:
+                    errors.append(error)
+                    stop.set()
+            return wrapper
+
+        @stage
+        def decode():
+            for start in range(0, n_frames, self.batch):
+                if stop.is_set():
+                    break
+                put(decoded, (start, self._decode_(start)))
+            for i in range(workers):
+                put(decoded, None)
+
+        @stage
+        def extract():
+            while not stop.is_set():
+                item = get(decoded)
+                if item is None:
+                    break
+                put(extracted, (item[0], self._extract_(item[1])))
+            put(extracted, None)
+
+        @stage
+        def score():
+            finished, done = 0, 0
+            while finished < workers and not stop.is_set():
+                item = get(extracted)
+                if item is None:
+                    finished += 1
+                    continue
+                start, values = item
+                intensities[start:start + len(values)] = values
+                scores[start:start + len(values)] = np.column_stack(goodness_of_fit(values, self.simulated))
+                done += len(values)
+                if progress is not None:
+                    progress(done, n_frames)
+
+        threads = [threading.Thread(target = decode), threading.Thread(target = score)] + [threading.Thread(target = extract) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        if directory is not None:
+            intensities.flush()
+            scores.flush()
+        return intensities, scores
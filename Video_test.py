@@ -0,0 +1,66 @@
+import threading
+import time
+import numpy as np
+import pytest
+import Errors
+import Video
+
+n_frames, shape = 37, (40, 50)
+rows, columns = [5, 12, 20, 33, 38], [4, 25, 47, 10, 30]
+
+@pytest.fixture
+def video(tmp_path):
+    frames = np.random.default_rng(0).integers(0, 4000, (n_frames,) + shape).astype(np.uint16)
+    filename = str(tmp_path / 'video.npy')
+    np.save(filename, frames)
+    return Video.open_video(filename)
+
+def serial(comparison):
+    intensities = np.vstack([comparison._extract_(comparison._decode_(start)) for start in range(0, n_frames, comparison.batch)])
+    return intensities, np.column_stack(Video.goodness_of_fit(intensities, comparison.simulated))
+
+@pytest.mark.parametrize('workers, queue_size', [(1, 1), (2, 1), (2, 4)])
+def test_pipeline_matches_serial(video, tmp_path, workers, queue_size):
+    comparison = Video.VideoComparison(video, rows, columns, [1., 2., 3., 4., 5.], Video.mean_background(video, 10), half_width = 2, half_height = 1, streak_length = 3, batch = 4)
+    done = []
+    intensities, scores = comparison.run(str(tmp_path / 'results'), workers, queue_size, lambda frames, total: done.append(frames))
+    expected_intensities, expected_scores = serial(comparison)
+    assert np.allclose(intensities, expected_intensities, rtol = 10 ** (-5)) and np.allclose(scores, expected_scores, rtol = 10 ** (-4), atol = 10 ** (-6))
+    assert np.array_equal(np.load(str(tmp_path / 'results' / 'scores.npy')), scores)
+    assert done[-1] == n_frames and done == sorted(done)
+
+class FailingExtraction(Video.VideoComparison):
+    def _extract_(self, stack):
+        if len(stack) < self.batch:
+            raise ValueError('extraction failed')
+        return Video.VideoComparison._extract_(self, stack)
+
+class FailingDecoding(Video.VideoComparison):
+    def _decode_(self, start):
+        if start >= 12:
+            raise ValueError('decoding failed')
+        return Video.VideoComparison._decode_(self, start)
+
+def failing_progress(frames, total):
+    if frames > 8:
+        raise RuntimeError('scoring failed')
+
+@pytest.mark.parametrize('comparison_class, progress, message', [(FailingDecoding, None, 'decoding failed'), (FailingExtraction, None, 'extraction failed'), (Video.VideoComparison, failing_progress, 'scoring failed')])
+def test_stage_failure_reaches_caller(video, comparison_class, progress, message):
+    before = threading.active_count()
+    comparison = comparison_class(video, rows, columns, np.ones(5), batch = 4)
+    start = time.perf_counter()
+    with pytest.raises(Exception, match = message):
+        comparison.run(workers = 2, queue_size = 1, progress = progress)
+    assert time.perf_counter() - start < 10. and threading.active_count() == before
+
+def test_open_raw_video(tmp_path):
+    filename = str(tmp_path / 'video.raw')
+    frames = np.arange(3 * 4 * 6, dtype = np.uint16).reshape(3, 4, 6)
+    with open(filename, 'wb') as output:
+        output.write(b'HEADER' + frames.tobytes())
+    assert np.array_equal(Video.open_video(filename, (4, 6), np.uint16, offset = 6), frames)
+    with pytest.raises(Errors.WrongVideoShape):
+        Video.open_video(filename, (4, 5), np.uint16, offset = 6)
+    with pytest.raises(Errors.WrongVideoShape):
+        Video.open_video(filename)
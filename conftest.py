@@ -0,0 +1,11 @@
+import pytest
+import Lattice
+
+@pytest.fixture
+def gallium_arsenide():
+    """
+    Factory of zincblende GaAs lattices oriented to the given Miller indexes.
+    """
+    def factory(miller_indexes, reconstruction = 'p-1X1-R0'):
+        return Lattice.Lattice(216, 5.6533, ['Ga', 'As'], [[0, 0, 0], [0.25, 0.25, 0.25]], miller_indexes, reconstruction)
+    return factory